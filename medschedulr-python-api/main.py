@@ -1,10 +1,21 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
-from typing import Dict, List, Optional, Any
+from typing import Deque, Dict, List, Optional, Any, Set
+from typing_extensions import TypedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 import datetime
 import asyncio
+import functools
+import hashlib
 import logging
+import multiprocessing
+import os
+import threading
+import time
+import orjson
 from prime_scheduler_wrapper import run_prime_scheduler
 
 # Configure logging
@@ -22,9 +33,93 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage for running jobs (in production, use Redis or database)
+# In-memory storage for running jobs (in production, use Redis or database).
+# Job state is per-process, so the API must run as a single uvicorn worker;
+# concurrent solves scale through solver_executor instead of extra workers.
 running_jobs: Dict[str, Dict] = {}
 
+# Job timestamps are monotonic_ns ints; they become datetimes only when served
+_WALL_ANCHOR = time.time()
+_MONOTONIC_ANCHOR_NS = time.monotonic_ns()
+
+def _to_datetime(monotonic_ns: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(_WALL_ANCHOR + (monotonic_ns - _MONOTONIC_ANCHOR_NS) / 1e9)
+
+# Monitoring indexes so list_jobs never walks the full job history
+active_jobs: Set[str] = set()
+recent_jobs: Deque[str] = deque(maxlen=100)
+
+# Solver runs in worker processes so the event loop stays free for status polls
+SOLVER_WORKERS = int(os.getenv("SOLVER_WORKERS", os.cpu_count() or 1))
+solver_executor = ProcessPoolExecutor(max_workers=SOLVER_WORKERS)
+# Each solve gets an even share of the cores, so a full pool never oversubscribes them
+CORES_PER_SOLVE = max(1, (os.cpu_count() or 1) // SOLVER_WORKERS)
+
+# Guards multi-field updates to running_jobs; never held across a solve
+jobs_lock = asyncio.Lock()
+
+# Finished jobs are evicted this long after their last update
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", 24 * 60 * 60))
+JOB_GC_INTERVAL_SECONDS = 300
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+# Successful results keyed by a hash of the solver config, so re-submitting an
+# identical roster is answered without another solve (least recently used first out)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 32))
+result_cache: "OrderedDict[str, bytes]" = OrderedDict()
+
+# Reject oversized payloads before they are read and validated
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", 64 * 1024 * 1024))
+
+class RequestSizeLimitMiddleware:
+    """
+    Answers 413 once a request body passes MAX_REQUEST_BYTES. A declared Content-Length
+    is rejected up front; chunked or undeclared bodies are counted as they are received,
+    so reading stops at the limit instead of buffering the whole upload.
+    """
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        detail = f"Request body exceeds {MAX_REQUEST_BYTES} bytes"
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > MAX_REQUEST_BYTES:
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+            return
+        
+        received = 0
+        response_started = False
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_REQUEST_BYTES:
+                    # Surfaces through FastAPI's body parsing as a normal 413 response
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+        
+        async def tracked_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except HTTPException as e:
+            # Raised outside a route's exception handling (e.g. by another middleware reading the body)
+            if e.status_code != 413 or response_started:
+                raise
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+
+app.add_middleware(RequestSizeLimitMiddleware)
+
 # Request/Response Models
 class DoctorInfo(BaseModel):
     id: str
@@ -44,7 +139,9 @@ class PostInfo(BaseModel):
     is_oncall: bool = True
     is_weekend_only: bool = False
 
-class AvailabilityRecord(BaseModel):
+# A TypedDict rather than a BaseModel: pydantic-core validates the (often very long)
+# availability list straight into plain dicts, without a model instance per record
+class AvailabilityRecord(TypedDict):
     doctor_id: str
     date: datetime.date
     post: str
@@ -74,6 +171,26 @@ class JobStatus(BaseModel):
     created_at: datetime.datetime
     updated_at: datetime.datetime
 
+@app.on_event("startup")
+async def start_background_work():
+    app.state.job_gc_task = asyncio.create_task(_evict_expired_jobs())
+    # Serves the one queue every solver process reports (job_id, progress) through;
+    # a single reader thread forwards it to the event loop
+    app.state.progress_manager = multiprocessing.Manager()
+    app.state.progress_queue = app.state.progress_manager.Queue()
+    app.state.progress_reader = threading.Thread(
+        target=_forward_progress, args=(app.state.progress_queue, asyncio.get_running_loop()),
+        name="progress-reader", daemon=True
+    )
+    app.state.progress_reader.start()
+
+@app.on_event("shutdown")
+def stop_background_work():
+    app.state.job_gc_task.cancel()
+    solver_executor.shutdown(wait=False, cancel_futures=True)
+    app.state.progress_queue.put(None)  # stops the reader thread
+    app.state.progress_manager.shutdown()
+
 @app.get("/")
 async def root():
     return {"message": "MedSchedulr Python API", "status": "running"}
@@ -89,19 +206,37 @@ async def generate_schedule(request: ScheduleRequest, background_tasks: Backgrou
     """
     try:
         job_id = f"job_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        config = _build_config(request)
+        config_key = _config_key(config)
+        cached_json = result_cache.get(config_key)
         
-        # Create job record
-        running_jobs[job_id] = {
-            "status": "pending",
-            "progress": 0.0,
-            "result": None,
-            "error": None,
-            "created_at": datetime.datetime.now(),
-            "updated_at": datetime.datetime.now()
-        }
+        # Create job record and index it in one step, like every other job mutation
+        async with jobs_lock:
+            running_jobs[job_id] = {
+                "status": "pending",
+                "progress": 0.0,
+                "result_json": None,  # result encoded once on completion, reused by every poll
+                "error": None,
+                "created_at_ns": time.monotonic_ns(),
+                "updated_at_ns": time.monotonic_ns(),
+                "version": 0  # bumped on every update; served as the status ETag
+            }
+            active_jobs.add(job_id)
+        
+        if cached_json is not None:
+            # Identical config already solved - complete the job without the solver,
+            # through the same update path (version, timestamp, indexes) as a solved job
+            result_cache.move_to_end(config_key)
+            await _update_job(job_id, status="completed", progress=1.0, result_json=cached_json)
+            logger.info(f"Job {job_id} served from result cache")
+            return ScheduleResponse(
+                job_id=job_id,
+                status="completed",
+                message="Schedule served from cache"
+            )
         
         # Start background task
-        background_tasks.add_task(run_scheduler, job_id, request)
+        background_tasks.add_task(run_scheduler, job_id, config, config_key)
         
         return ScheduleResponse(
             job_id=job_id,
@@ -113,23 +248,43 @@ async def generate_schedule(request: ScheduleRequest, background_tasks: Backgrou
         logger.error(f"Error starting schedule generation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Read-only job endpoints are plain `def` so Starlette runs them in its threadpool
+# and building large responses never stalls the event loop. Endpoints that take
+# jobs_lock stay `async def`, since asyncio.Lock belongs to the event loop.
 @app.get("/schedule/status/{job_id}", response_model=JobStatus)
-async def get_job_status(job_id: str):
+def get_job_status(job_id: str, request: Request):
     """
-    Get the status of a running schedule generation job
+    Get the status of a running schedule generation job.
+    Honors If-None-Match so unchanged polls get an empty 304.
     """
-    if job_id not in running_jobs:
+    job_data = running_jobs.get(job_id)
+    if job_data is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    job_data = running_jobs[job_id]
-    return JobStatus(
-        job_id=job_id,
-        status=job_data["status"],
-        progress=job_data.get("progress"),
-        result=job_data.get("result"),
-        error=job_data.get("error"),
-        created_at=job_data["created_at"],
-        updated_at=job_data["updated_at"]
+    etag = f'"{job_data["version"]}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    # The body is a raw Response, so FastAPI never applies response_model to it;
+    # unset fields are stripped here by hand rather than sent as null
+    envelope = {
+        "job_id": job_id,
+        "status": job_data["status"],
+        "progress": job_data.get("progress"),
+        "error": job_data.get("error"),
+        "created_at": _to_datetime(job_data["created_at_ns"]),
+        "updated_at": _to_datetime(job_data["updated_at_ns"])
+    }
+    body = orjson.dumps({key: value for key, value in envelope.items() if value is not None})
+    
+    # Splice the pre-encoded result into the envelope instead of re-serializing it
+    result_json = job_data.get("result_json")
+    if result_json is not None:
+        body = body[:-1] + b',"result":' + result_json + b"}"
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"}
     )
 
 @app.delete("/schedule/{job_id}")
@@ -137,111 +292,166 @@ async def cancel_job(job_id: str):
     """
     Cancel a running job (if possible)
     """
-    if job_id not in running_jobs:
-        raise HTTPException(status_code=404, detail="Job not found")
-    
-    job_data = running_jobs[job_id]
-    if job_data["status"] in ["pending", "running"]:
-        job_data["status"] = "cancelled"
-        job_data["updated_at"] = datetime.datetime.now()
-        return {"message": "Job cancelled", "job_id": job_id}
-    else:
-        return {"message": "Job cannot be cancelled", "status": job_data["status"]}
+    async with jobs_lock:
+        job_data = running_jobs.get(job_id)
+        if job_data is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job_data["status"] in ["pending", "running"]:
+            job_data["status"] = "cancelled"
+            job_data["updated_at_ns"] = time.monotonic_ns()
+            job_data["version"] += 1
+            _index_finished_job(job_id)
+            return {"message": "Job cancelled", "job_id": job_id}
+        else:
+            return {"message": "Job cannot be cancelled", "status": job_data["status"]}
 
 @app.get("/schedule/jobs")
-async def list_jobs():
+def list_jobs():
     """
-    List all jobs (for debugging/monitoring)
+    List active jobs and the most recently finished ones (for debugging/monitoring)
     """
+    def summarize(job_ids):
+        summaries = []
+        for job_id in job_ids:
+            job_data = running_jobs.get(job_id)
+            if job_data is not None:  # may have been evicted since it was indexed
+                summaries.append({
+                    "job_id": job_id,
+                    "status": job_data["status"],
+                    "created_at": _to_datetime(job_data["created_at_ns"]),
+                    "updated_at": _to_datetime(job_data["updated_at_ns"])
+                })
+        return summaries
+    
+    # Snapshot the indexes; the event loop may update them concurrently
     return {
-        "jobs": [
-            {
-                "job_id": job_id,
-                "status": job_data["status"],
-                "created_at": job_data["created_at"],
-                "updated_at": job_data["updated_at"]
-            }
-            for job_id, job_data in running_jobs.items()
-        ]
+        "active": summarize(list(active_jobs)),
+        "recent": summarize(list(recent_jobs))
     }
 
-async def run_scheduler(job_id: str, request: ScheduleRequest):
+async def _update_job(job_id: str, **fields) -> bool:
+    """
+    Atomically apply fields to a job record and stamp updated_at.
+    Returns False (and leaves the record untouched) if the job already finished
+    (cancelled included) or was evicted, so late progress never reopens a job.
+    """
+    async with jobs_lock:
+        job_data = running_jobs.get(job_id)
+        if job_data is None or job_data["status"] in FINISHED_STATUSES:
+            return False
+        job_data.update(fields)
+        job_data["updated_at_ns"] = time.monotonic_ns()
+        job_data["version"] += 1
+        if job_data["status"] in FINISHED_STATUSES:
+            _index_finished_job(job_id)
+        return True
+
+def _index_finished_job(job_id: str):
+    """Move a job from the active index to the recent list (caller holds jobs_lock)"""
+    active_jobs.discard(job_id)
+    recent_jobs.appendleft(job_id)
+
+async def _set_progress(job_id: str, progress: float) -> bool:
+    return await _update_job(job_id, progress=progress)
+
+async def _fail_job(job_id: str, error: str) -> bool:
+    return await _update_job(job_id, status="failed", error=error)
+
+def _put_progress(progress_queue, job_id: str, progress: float):
+    """Progress callback run in the solver process: tags the value with its job"""
+    progress_queue.put((job_id, progress))
+
+def _forward_progress(progress_queue, loop: asyncio.AbstractEventLoop):
+    """
+    Reader thread body: hands (job_id, progress) pairs from solver processes to the
+    event loop until the None sentinel, or until the Manager goes away
+    """
+    while True:
+        try:
+            item = progress_queue.get()
+        except (EOFError, OSError):
+            return
+        if item is None:
+            return
+        job_id, progress = item
+        asyncio.run_coroutine_threadsafe(_set_progress(job_id, progress), loop)
+
+async def _evict_expired_jobs():
+    """
+    Periodically drop finished jobs (and their results) older than JOB_TTL_SECONDS
+    """
+    while True:
+        await asyncio.sleep(JOB_GC_INTERVAL_SECONDS)
+        cutoff_ns = time.monotonic_ns() - JOB_TTL_SECONDS * 1_000_000_000
+        async with jobs_lock:
+            expired = [
+                job_id for job_id, job_data in running_jobs.items()
+                if job_data["status"] in FINISHED_STATUSES and job_data["updated_at_ns"] < cutoff_ns
+            ]
+            for job_id in expired:
+                del running_jobs[job_id]
+        if expired:
+            logger.info(f"Evicted {len(expired)} expired jobs")
+
+def _build_config(request: ScheduleRequest) -> Dict[str, Any]:
+    """
+    Convert a request to the prime scheduler config (dates become ISO strings)
+    """
+    config = request.model_dump(mode="json")
+    
+    # Drop repeated (doctor, date, post) rows; the last one wins, as in the solver
+    config["availability"] = list({
+        (avail["doctor_id"], avail["date"], avail["post"]): avail
+        for avail in config["availability"]
+    }.values())
+    return config
+
+def _config_key(config: Dict[str, Any]) -> str:
+    return hashlib.blake2b(orjson.dumps(config, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+def _cache_result(config_key: str, result_json: bytes):
+    result_cache[config_key] = result_json
+    result_cache.move_to_end(config_key)
+    while len(result_cache) > RESULT_CACHE_SIZE:
+        result_cache.popitem(last=False)
+
+async def run_scheduler(job_id: str, config: Dict[str, Any], config_key: str):
     """
     Background task to run the medical scheduler
     """
     try:
         # Update job status
-        running_jobs[job_id]["status"] = "running"
-        running_jobs[job_id]["progress"] = 0.0
-        running_jobs[job_id]["updated_at"] = datetime.datetime.now()
+        if not await _update_job(job_id, status="running", progress=0.0):
+            logger.info(f"Job {job_id} was cancelled before it started")
+            return
         
         logger.info(f"Starting schedule generation for job {job_id}")
         
-        # Convert request to config for prime scheduler
-        config = {
-            "roster_start": request.roster_start.strftime('%Y-%m-%d'),
-            "roster_end": request.roster_end.strftime('%Y-%m-%d'),
-            "doctors": [
-                {
-                    "id": doctor.id,
-                    "name": doctor.name,
-                    "unit": doctor.unit,
-                    "category": doctor.category,
-                    "last_standby": doctor.last_standby.strftime('%Y-%m-%d') if doctor.last_standby else None,
-                    "workload": doctor.workload
-                }
-                for doctor in request.doctors
-            ],
-            "units": [
-                {
-                    "name": unit.name,
-                    "clinic_days": unit.clinic_days
-                }
-                for unit in request.units
-            ],
-            "posts_weekday": request.posts_weekday,
-            "posts_weekend": request.posts_weekend,
-            "availability": [
-                {
-                    "doctor_id": avail.doctor_id,
-                    "date": avail.date.strftime('%Y-%m-%d'),
-                    "post": avail.post,
-                    "available": avail.available
-                }
-                for avail in request.availability
-            ],
-            "solver_config": request.solver_config
-        }
+        # Data is set up - hand off to the solver
+        await _set_progress(job_id, 0.4)
         
-        # Set up data
-        running_jobs[job_id]["progress"] = 0.2
-        running_jobs[job_id]["updated_at"] = datetime.datetime.now()
-        
-        # Run prime scheduler directly
-        running_jobs[job_id]["progress"] = 0.4
-        running_jobs[job_id]["updated_at"] = datetime.datetime.now()
-        
-        result = run_prime_scheduler(config)
+        # Nothing is held per job while it waits for a pool slot; its progress
+        # arrives through the shared queue once a solver process runs it
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            solver_executor, run_prime_scheduler, config,
+            functools.partial(_put_progress, app.state.progress_queue, job_id), CORES_PER_SOLVE
+        )
         
         # Update final status
         if result.get("success", False):
-            running_jobs[job_id]["status"] = "completed"
-            running_jobs[job_id]["progress"] = 1.0
-            running_jobs[job_id]["result"] = result
-            running_jobs[job_id]["updated_at"] = datetime.datetime.now()
+            result_json = orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY)
+            _cache_result(config_key, result_json)
+            await _update_job(job_id, status="completed", progress=1.0, result_json=result_json)
         else:
-            running_jobs[job_id]["status"] = "failed"
-            running_jobs[job_id]["error"] = result.get("error", "Unknown solver error")
-            running_jobs[job_id]["updated_at"] = datetime.datetime.now()
+            await _fail_job(job_id, result.get("error", "Unknown solver error"))
         
         logger.info(f"Schedule generation completed for job {job_id}")
         
     except Exception as e:
         logger.error(f"Error in schedule generation for job {job_id}: {e}")
-        running_jobs[job_id]["status"] = "failed"
-        running_jobs[job_id]["error"] = str(e)
-        running_jobs[job_id]["updated_at"] = datetime.datetime.now()
+        await _fail_job(job_id, str(e))
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
\ No newline at end of file
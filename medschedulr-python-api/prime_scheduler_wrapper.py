@@ -6,13 +6,19 @@ This preserves all the original logic and constraints from the fine-tuned schedu
 
 import cvxpy as cp
 import numpy as np
+import scipy.sparse as sp
 import pandas as pd
 import datetime
+import hashlib
+import itertools
 import math
-import json
+import orjson
 import sys
 import logging
-from typing import Dict, List, Any, Tuple
+import multiprocessing
+import os
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, Any, NamedTuple, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +26,30 @@ logger = logging.getLogger(__name__)
 STANDBY_REST_PENALTY_WEIGHT = 1000    # Heavy penalty for rest violations
 STANDBY_MISMATCH_PENALTY_WEIGHT = 2000  # Even heavier penalty for different doctors
 
+# Compiled models kept per worker process, keyed by model structure, so re-runs that
+# only change penalty weights skip canonicalization (least recently used first out)
+MODEL_CACHE_SIZE = 4
+_model_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+# Doctor categories as small integer codes for vectorized masks (-1 = unknown)
+SENIOR, REGISTRAR, JUNIOR, FLOATER = range(4)
+CATEGORY_CODES = {"senior": SENIOR, "registrar": REGISTRAR, "junior": JUNIOR, "floater": FLOATER}
+
+# --------------------------------------------------------------------------------
+class PhaseResult(NamedTuple):
+    """Outcome of one solve phase as plain values, so it can cross a process boundary"""
+    status: str
+    value: Optional[float]
+    x: Optional[np.ndarray]
+    y: Optional[np.ndarray]
+
+# --------------------------------------------------------------------------------
+def _indicator_matrix(rows: List[List[int]], n_cols: int) -> sp.csr_matrix:
+    """Sparse 0/1 matrix with a 1 in row i at each column listed in rows[i]"""
+    indptr = np.cumsum([0] + [len(row) for row in rows])
+    indices = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64, count=indptr[-1])
+    return sp.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(rows), n_cols))
+
 # --------------------------------------------------------------------------------
 # Utility to compute full months difference between two dates
 def months_since(start_date, end_date):
@@ -29,42 +59,44 @@ def months_since(start_date, end_date):
     return (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
 
 # --------------------------------------------------------------------------------
-def check_standby_pairing_feasibility(availability, date_list, doctors):
-    """Check if Saturday/Sunday pairing is possible for Standby Oncall"""
+def check_standby_pairing_feasibility(availability, date_list, doctors, standby_t):
+    """Check if Saturday/Sunday pairing is possible for Standby Oncall.
+    
+    availability is the (doctor, day, post) bool tensor and standby_t the Standby Oncall post index.
+    """
     warnings = []
     pairing_relaxed = False
+    if standby_t is None:
+        return warnings, pairing_relaxed
     
-    for i in range(len(date_list)-1):
-        current_date = date_list[i]
-        next_date = date_list[i+1]
-        
-        # Check if this is a Sat->Sun pair
-        if current_date.weekday() == 5 and next_date.weekday() == 6:  # Sat->Sun
-            sat_doctors = set()
-            sun_doctors = set()
-            
-            for d in doctors:
-                if availability.get((d, i, 'Standby Oncall'), False):
-                    sat_doctors.add(d)
-                if availability.get((d, i+1, 'Standby Oncall'), False):
-                    sun_doctors.add(d)
-            
-            intersection = sat_doctors.intersection(sun_doctors)
-            
-            if not intersection:
-                warning = f"Standby Oncall pairing will be relaxed for {current_date.strftime('%Y-%m-%d')}->{next_date.strftime('%Y-%m-%d')}: no doctors available both days"
-                warnings.append(warning)
-                pairing_relaxed = True
-                logger.warning(f"⚠️  {warning}")
-                logger.info(f"    Saturday available: {sorted(sat_doctors)}")
-                logger.info(f"    Sunday available: {sorted(sun_doctors)}")
-            else:
-                logger.info(f"✅ Standby Oncall pairing feasible for {current_date.strftime('%Y-%m-%d')}->{next_date.strftime('%Y-%m-%d')}: {len(intersection)} doctors available both days ({sorted(intersection)})")
+    # Sat->Sun pairs, and the doctors available for Standby on both days of each
+    weekdays = np.array([date.weekday() for date in date_list], dtype=np.int8)
+    saturdays = np.flatnonzero((weekdays[:-1] == 5) & (weekdays[1:] == 6))
+    standby_available = availability[:, :, standby_t]
+    sat_available = standby_available[:, saturdays]
+    sun_available = standby_available[:, saturdays + 1]
+    both_available = sat_available & sun_available
+    
+    for w, s in enumerate(saturdays.tolist()):
+        pair = f"{date_list[s].strftime('%Y-%m-%d')}->{date_list[s + 1].strftime('%Y-%m-%d')}"
+        intersection = [doctors[d] for d in np.flatnonzero(both_available[:, w])]
+        
+        if not intersection:
+            warning = f"Standby Oncall pairing will be relaxed for {pair}: no doctors available both days"
+            warnings.append(warning)
+            pairing_relaxed = True
+            logger.warning(f"⚠️  {warning}")
+            logger.info(f"    Saturday available: {sorted(doctors[d] for d in np.flatnonzero(sat_available[:, w]))}")
+            logger.info(f"    Sunday available: {sorted(doctors[d] for d in np.flatnonzero(sun_available[:, w]))}")
+        else:
+            logger.info(f"✅ Standby Oncall pairing feasible for {pair}: {len(intersection)} doctors available both days ({sorted(intersection)})")
     
     return warnings, pairing_relaxed
 
 # --------------------------------------------------------------------------------
-def run_prime_scheduler(config: Dict[str, Any]) -> Dict[str, Any]:
+def run_prime_scheduler(config: Dict[str, Any],
+                        progress_callback: Optional[Callable[[float], None]] = None,
+                        cores: Optional[int] = None) -> Dict[str, Any]:
     """
     Main function that runs the prime scheduler with JSON input/output
     
@@ -78,10 +110,18 @@ def run_prime_scheduler(config: Dict[str, Any]) -> Dict[str, Any]:
             - posts_weekend: List of weekend posts
             - availability: List of availability records
             - solver_config: Solver parameters (lambda weights, etc.)
+        progress_callback: Optional callable receiving a 0-1 progress fraction
+            as the run passes each milestone (model built, phase solved, ...)
+        cores: CPU cores this run may use (defaults to all of them); callers running
+            several solves at once pass their share
     
     Returns:
         Dictionary containing schedule results
     """
+    def report_progress(progress: float):
+        if progress_callback is not None:
+            progress_callback(progress)
+    
     try:
         # Parse input dates
         roster_start = datetime.datetime.strptime(config['roster_start'], '%Y-%m-%d').date()
@@ -94,6 +134,13 @@ def run_prime_scheduler(config: Dict[str, Any]) -> Dict[str, Any]:
             date_list.append(current)
             current += datetime.timedelta(days=1)
         
+        # Date -> roster day index, for O(1) lookups while parsing records
+        date_to_idx = {date: idx for idx, date in enumerate(date_list)}
+        
+        # Weekday of each roster day (0=Mon..6=Sun), computed once
+        day_weekday = [date.weekday() for date in date_list]
+        weekday_arr = np.array(day_weekday, dtype=np.int8)
+        
         logger.info(f"Processing roster period: {roster_start} to {roster_end} ({len(date_list)} days)")
         
         # Extract clinic days configuration from units
@@ -101,6 +148,9 @@ def run_prime_scheduler(config: Dict[str, Any]) -> Dict[str, Any]:
         for unit in config['units']:
             clinic_days[unit['name']] = unit['clinic_days']
         
+        # Clinic weekdays per unit as a 7-bit mask: (mask >> weekday) & 1
+        clinic_day_mask = {u: sum(1 << wd for wd in set(days)) for u, days in clinic_days.items()}
+        
         # Extract posts configuration  
         posts_weekday = config['posts_weekday'].copy()
         posts_weekend = config['posts_weekend']
@@ -117,143 +167,117 @@ def run_prime_scheduler(config: Dict[str, Any]) -> Dict[str, Any]:
         # On-call posts for rest/spacing logic (include wards, ED, and standby, but NOT clinics)
         oncall_posts = set(posts_weekday + posts_weekend) - {f"clinic:{u}" for u in clinic_days.keys()}
         
-        # Extract doctor information and build doctor_info dict
-        doctors = []
-        doctor_info = {}
-        
-        for doc in config['doctors']:
-            doctors.append(doc['id'])
-            doctor_info[doc['id']] = {
-                "unit": doc['unit'],
-                "category": doc['category'],
-                "last_standby": datetime.datetime.strptime(doc['last_standby'], '%Y-%m-%d').date() if doc['last_standby'] else None,
-                "workload": doc['workload']
-            }
-        
-        # Extract enhanced workload data - ALWAYS provided now
-        workload_data = {}
-        if 'workload_data' in config and config['workload_data']:
-            for wd in config['workload_data']:
-                workload_data[wd['doctor_id']] = {
-                    "weekday_oncalls_3m": wd['weekday_oncalls_3m'],
-                    "weekend_oncalls_3m": wd['weekend_oncalls_3m'],
-                    "ed_covers_3m": wd['ed_covers_3m'],
-                    "days_since_last_standby": wd['days_since_last_standby'],
-                    "standby_count_12m": wd['standby_count_12m'],
-                    "standby_count_3m": wd['standby_count_3m']
-                }
-            logger.info(f"Enhanced workload data loaded for {len(workload_data)} doctors")
+        # Doctor attributes as arrays indexed like doctors
+        doctors = [doc['id'] for doc in config['doctors']]
+        category_code = np.array([CATEGORY_CODES.get(doc['category'], -1) for doc in config['doctors']], dtype=np.int8)
+        doc_units = [doc['unit'] for doc in config['doctors']]
+        
+        # Extract enhanced workload data - ALWAYS provided now. One row per doctor (in doctors
+        # order); doctors without a record get zero counts and no standby for 9999 days
+        workload_columns = ["weekday_oncalls_3m", "weekend_oncalls_3m", "ed_covers_3m",
+                            "days_since_last_standby", "standby_count_12m", "standby_count_3m"]
+        workload_records = config.get('workload_data') or []
+        workload_df = (
+            pd.DataFrame(workload_records, columns=["doctor_id", *workload_columns])
+            .drop_duplicates("doctor_id", keep="last")
+            .set_index("doctor_id")
+            .reindex(doctors)
+            .fillna({"days_since_last_standby": 9999})
+            .fillna(0)
+        )
+        if workload_records:
+            logger.info(f"Enhanced workload data loaded for {len({wd['doctor_id'] for wd in workload_records})} doctors")
         else:
-            # Ensure zero data for all doctors if no workload data provided
-            for d in doctors:
-                workload_data[d] = {
-                    "weekday_oncalls_3m": 0,
-                    "weekend_oncalls_3m": 0,
-                    "ed_covers_3m": 0,
-                    "days_since_last_standby": 9999,
-                    "standby_count_12m": 0,
-                    "standby_count_3m": 0
-                }
-            logger.info(f"No workload data provided - using zeros for {len(workload_data)} doctors")
+            logger.info(f"No workload data provided - using zeros for {len(doctors)} doctors")
         
         logger.info(f"Processing {len(doctors)} doctors across {len(clinic_days)} units")
         
-        # Build posts_by_day mapping based on weekday/weekend of each date
-        # IMPORTANT: Filter clinic posts to only appear on their unit's clinic days
-        posts_by_day = {}
-        for idx, date in enumerate(date_list):
-            if date.weekday() >= 5:  # Weekend
-                posts_by_day[idx] = posts_weekend
-            else:  # Weekday
-                day_posts = []
-                # Add non-clinic weekday posts
-                for post in posts_weekday:
-                    if not post.startswith("clinic:"):
-                        day_posts.append(post)
-                
-                # Add clinic posts only if this weekday is a clinic day for that unit
-                weekday = date.weekday()
-                for unit_name, clinic_weekdays in clinic_days.items():
-                    if weekday in clinic_weekdays:
-                        clinic_post = f"clinic:{unit_name}"
-                        if clinic_post not in day_posts:
-                            day_posts.append(clinic_post)
-                
-                posts_by_day[idx] = day_posts
-        
-        # Log posts_by_day for verification
-        sample_days = min(3, len(date_list))
-        for i in range(sample_days):
-            logger.info(f"Day {i} ({date_list[i]}): {posts_by_day[i]}")
-        
         # Sets for CVXPY
         D = doctors
         S = list(range(len(date_list)))
         
-        # Precompute unit->doctor list (used in per-unit/day soft cap)
+        # Integer ids for doctors and posts, so availability can be a dense
+        # (doctor, day, post) bool tensor instead of a dict of tuples
+        all_posts = list(dict.fromkeys(posts_weekday + posts_weekend))
+        doc_idx = {d: i for i, d in enumerate(D)}
+        post_idx = {t: i for i, t in enumerate(all_posts)}
+        
+        # Each doctor's unit as an index into units (-1 when the unit has no clinic config),
+        # and the doctor ids of each unit (used in clinic defaults and the per-unit/day soft cap)
         units = list(clinic_days.keys())
-        unit_to_docs = {u: [d for d in D if doctor_info[d]['unit'] == u] for u in units}
-        
-        # Convert availability data to lookup dict
-        availability = {}
-        for avail in config['availability']:
-            # Convert date string to date index
-            avail_date = datetime.datetime.strptime(avail['date'], '%Y-%m-%d').date()
-            if avail_date in date_list:
-                date_idx = date_list.index(avail_date)
-                key = (avail['doctor_id'], date_idx, avail['post'])
-                availability[key] = avail['available']
-        
-        # Fill in missing availability with False (not available)  
-        # Special handling for clinic posts - only available for doctors in the right unit
-        for d in D:
-            for s in S:
-                for t in posts_by_day[s]:
-                    if (d, s, t) not in availability:
-                        # For clinic posts, check if doctor is in the right unit
-                        if t.startswith("clinic:"):
-                            unit_name = t.split(":", 1)[1]
-                            doctor_unit = doctor_info[d]["unit"]
-                            # Only make available if on clinic day and in right unit
-                            if (doctor_unit == unit_name and 
-                                date_list[s].weekday() in clinic_days.get(unit_name, [])):
-                                availability[(d, s, t)] = True
-                            else:
-                                availability[(d, s, t)] = False
-                        else:
-                            # Non-clinic posts default to False
-                            availability[(d, s, t)] = False
+        unit_id = {u: u_i for u_i, u in enumerate(units)}
+        doc_unit_id = np.array([unit_id.get(unit, -1) for unit in doc_units], dtype=np.int64)
+        unit_doc_idx = {u: np.flatnonzero(doc_unit_id == u_i) for u_i, u in enumerate(units)}
+        
+        # unit_clinic_day[u][s]: day s falls on one of unit u's clinic weekdays
+        unit_clinic_day = {u: ((mask >> weekday_arr.astype(np.int64)) & 1).astype(np.bool_)
+                           for u, mask in clinic_day_mask.items()}
+        
+        # post_valid[s, t] is True iff post t is worked on day s: weekend posts on weekends,
+        # non-clinic weekday posts on weekdays, and each clinic post only on its unit's clinic days
+        # IMPORTANT: Filter clinic posts to only appear on their unit's clinic days
+        weekend_post = np.array([t in posts_weekend for t in all_posts], dtype=np.bool_)
+        weekday_post = np.array([t in posts_weekday and not t.startswith("clinic:") for t in all_posts], dtype=np.bool_)
+        is_weekend = weekday_arr >= 5
+        post_valid = np.where(is_weekend[:, None], weekend_post[None, :], weekday_post[None, :])
+        for u, clinic_day_s in unit_clinic_day.items():
+            post_valid[clinic_day_s & ~is_weekend, post_idx[f"clinic:{u}"]] = True
+        
+        # Log posts per day for verification
+        sample_days = min(3, len(date_list))
+        for i in range(sample_days):
+            logger.info(f"Day {i} ({date_list[i]}): {[all_posts[t] for t in np.flatnonzero(post_valid[i])]}")
+        
+        # Default availability: clinic posts are open to the unit's own doctors on
+        # its clinic days; every other slot is unavailable unless a record says otherwise
+        availability = np.zeros((len(D), len(S), len(all_posts)), dtype=np.bool_)
+        for u, clinic_day_s in unit_clinic_day.items():
+            availability[np.ix_(unit_doc_idx[u], np.flatnonzero(clinic_day_s), [post_idx[f"clinic:{u}"]])] = True
+        
+        # Apply availability records over the defaults in one scatter. Each distinct date
+        # string is parsed once; ids outside the roster map to -1 and the record is skipped
+        records = config['availability']
+        if records:
+            day_of = {}
+            for date_str in {avail['date'] for avail in records}:
+                avail_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
+                day_of[date_str] = date_to_idx.get(avail_date, -1)
+            rec_d = np.array([doc_idx.get(avail['doctor_id'], -1) for avail in records], dtype=np.int64)
+            rec_s = np.array([day_of[avail['date']] for avail in records], dtype=np.int64)
+            rec_t = np.array([post_idx.get(avail['post'], -1) for avail in records], dtype=np.int64)
+            rec_available = np.array([bool(avail['available']) for avail in records], dtype=np.bool_)
+            valid = (rec_d >= 0) & (rec_s >= 0) & (rec_t >= 0)
+            flat = np.ravel_multi_index((rec_d[valid], rec_s[valid], rec_t[valid]), availability.shape)
+            # Later records win, as with sequential assignment
+            _, last = np.unique(flat[::-1], return_index=True)
+            last = len(flat) - 1 - last
+            availability.flat[flat[last]] = rec_available[valid][last]
+        
+        # Only posts that are actually worked on a day can be assigned
+        availability &= post_valid
         
         # REMOVED: No longer force D[0] availability - rely on Phase 2 relaxation instead
         # Check for posts with no available doctors (will be handled by Phase 2 slack)
-        for s in S:
-            for t in posts_by_day[s]:
-                available_doctors = [d for d in D if availability.get((d, s, t), False)]
-                if not available_doctors:
-                    logger.warning(f"⚠️  No doctors available for {t} on day {s} ({date_list[s]}) - will use Phase 2 relaxation")
+        uncovered = np.argwhere(post_valid & ~availability.any(axis=0))
+        for s, t in uncovered.tolist():
+            logger.warning(f"⚠️  No doctors available for {all_posts[t]} on day {s} ({date_list[s]}) - will use Phase 2 relaxation")
         
-        logger.info(f"Availability records: {len([k for k, v in availability.items() if v])}/{len(availability)} available")
+        logger.info(f"Availability records: {availability.sum()}/{post_valid.sum() * len(D)} available")
         
         # Debug: Log availability breakdown by post
-        post_availability = {}
-        for (d, s, t), avail in availability.items():
-            if t not in post_availability:
-                post_availability[t] = {'available': 0, 'total': 0}
-            post_availability[t]['total'] += 1
-            if avail:
-                post_availability[t]['available'] += 1
-        
+        available_by_post = availability.sum(axis=(0, 1))
+        total_by_post = post_valid.sum(axis=0) * len(D)
         logger.info("Post availability breakdown:")
-        for post, counts in post_availability.items():
-            logger.info(f"  {post}: {counts['available']}/{counts['total']} available")
+        for t, post in enumerate(all_posts):
+            logger.info(f"  {post}: {available_by_post[t]}/{total_by_post[t]} available")
         
         # Debug: Log weekend Standby Oncall specifically
         standby_weekend_available = []
-        for s in S:
-            if date_list[s].weekday() >= 5:  # Weekend
-                for d in D:
-                    if availability.get((d, s, "Standby Oncall"), False):
-                        standby_weekend_available.append((d, date_list[s]))
+        if "Standby Oncall" in post_idx:
+            weekend_days = [s for s in S if day_weekday[s] >= 5]
+            standby_available = availability[:, weekend_days, post_idx["Standby Oncall"]]
+            for s_pos, d in sorted((s_pos, d) for d, s_pos in zip(*np.nonzero(standby_available))):
+                standby_weekend_available.append((D[d], date_list[weekend_days[s_pos]]))
         
         logger.info(f"Standby Oncall weekend availability: {len(standby_weekend_available)} slots")
         if standby_weekend_available:
@@ -277,390 +301,515 @@ def run_prime_scheduler(config: Dict[str, Any]) -> Dict[str, Any]:
         lambda_junior_ward = solver_config.get('lambdaJuniorWard', 6)
         BIG_M = solver_config.get('bigM', 10000.0)
         solver_timeout = solver_config.get('solverTimeoutSeconds', 600)
+        mip_gap = float(solver_config.get('mipGap', 0.01))  # relative optimality gap
+        # Solve Phase 2 alongside Phase 1 instead of waiting for Phase 1 to fail
+        # (only pays off when a second core is free for the speculative solve)
+        cores = cores or os.cpu_count() or 1
+        parallel_phases = (solver_config.get('parallelPhases', cores > 1)
+                           and 'fork' in multiprocessing.get_all_start_methods())
         
         # --------------------------------------------------------------------------------
         # Identify weekend pairs (Sat->Sun)
-        weekend_pairs = []
-        for s in range(len(date_list) - 1):
-            current_date = date_list[s]
-            next_date = date_list[s+1]
-            if current_date.weekday() == 5 and next_date.weekday() == 6:  # Sat->Sun
-                weekend_pairs.append((s, s+1))
+        saturdays = np.flatnonzero((weekday_arr[:-1] == 5) & (weekday_arr[1:] == 6))
+        weekend_pairs = list(zip(saturdays.tolist(), (saturdays + 1).tolist()))
         
         logger.info(f"🗓️  Found {len(weekend_pairs)} weekend pairs for Standby Oncall constraint")
         for i, (sat_day, sun_day) in enumerate(weekend_pairs):
             logger.info(f"   Weekend {i}: {date_list[sat_day]} -> {date_list[sun_day]}")
         
-        # Helper that builds & solves the model
-        def build_and_solve(RELAX: bool):
+        # --------------------------------------------------------------------------------
+        # Index the model once; both phases share it. Every x variable is one entry of a
+        # single boolean vector X, created only where the doctor is available, and each
+        # constraint family is a sparse 0/1 matrix over X (one row per constraint).
+        # var_id[d, s, t] is the X entry for that slot, or -1 where there is none
+        n_vars = int(availability.sum())
+        var_id = np.full(availability.shape, -1, dtype=np.int64)
+        var_id[availability] = np.arange(n_vars)
+        var_d, var_s, var_t = np.nonzero(availability)  # (doctor, day, post) of each X entry
+        
+        def var_rows(rows):
+            """Sparse 0/1 matrix whose i-th row sums the X entries listed in rows[i]"""
+            return _indicator_matrix(rows, n_vars)
+        
+        def existing(ids):
+            return ids[ids >= 0].tolist()
+        
+        # Post masks over all_posts
+        all_post_mask = np.ones(len(all_posts), dtype=np.bool_)
+        clinic_post_mask = np.array([t.startswith("clinic:") for t in all_posts], dtype=np.bool_)
+        oncall_post_mask = np.array([t in oncall_posts for t in all_posts], dtype=np.bool_)
+        oncall_non_standby_mask = oncall_post_mask & np.array([t != "Standby Oncall" for t in all_posts], dtype=np.bool_)
+        standby_t = post_idx.get("Standby Oncall")
+        
+        # Coverage: one row per (day, post) that has any available doctor
+        coverage_rows = [rows for rows in (
+            existing(var_id[:, s, t]) for s in S for t in np.flatnonzero(post_valid[s])
+        ) if rows]
+        
+        # One post per day, and at most one clinic per day, per doctor
+        day_rows = [rows for rows in (existing(var_id[d, s]) for d in range(len(D)) for s in S) if rows]
+        clinic_day_rows = [rows for rows in (
+            existing(var_id[d, s, clinic_post_mask]) for d in range(len(D)) for s in S
+        ) if rows]
+        
+        # Clinic coverage: one row per (unit, clinic day)
+        clinic_cover_rows = []
+        for u, clinic_day_s in unit_clinic_day.items():
+            clinic_t = post_idx[f"clinic:{u}"]
+            for s in np.flatnonzero(clinic_day_s & post_valid[:, clinic_t]):
+                rows = existing(var_id[unit_doc_idx[u], s, clinic_t])
+                if rows:
+                    clinic_cover_rows.append(rows)
+        
+        # Standby weekends: (doctor, weekend) pairs with both Sat and Sun vars get a linked y;
+        # the rest have y forced to 0. sat_ids/sun_ids[d, w] are X entries (or -1)
+        y_ids = np.arange(len(D) * len(weekend_pairs)).reshape(len(D), len(weekend_pairs))
+        if weekend_pairs and standby_t is not None:
+            sat_days, sun_days = np.array(weekend_pairs).T
+            sat_ids = var_id[:, sat_days, standby_t]
+            sun_ids = var_id[:, sun_days, standby_t]
+        else:
+            sat_ids = sun_ids = np.full(y_ids.shape, -1, dtype=np.int64)
+        linked = (sat_ids >= 0) & (sun_ids >= 0)
+        standby_linked = np.column_stack([y_ids[linked], sat_ids[linked], sun_ids[linked]])  # (y, sat, sun)
+        standby_unlinked = y_ids[~linked]
+        
+        # On-call X entries per (doctor, day): row d * n_days + s of by_day(mask) picks the
+        # doctor's entries that day on the posts in mask. The rest and gap rows are sums of
+        # two such rows, gathered for every (doctor, day) at once
+        n_days = len(S)
+        day_row = var_d * n_days + var_s
+        
+        def by_day(post_mask):
+            selected = np.flatnonzero(post_mask[var_t])
+            return sp.csr_matrix((np.ones(len(selected)), (day_row[selected], selected)),
+                                 shape=(len(D) * n_days, n_vars))
+        
+        def paired_rows(day_vars, first, second):
+            """Rows first[i] + second[i] of day_vars, for the pairs where both are non-empty"""
+            counts = np.diff(day_vars.indptr)
+            both = (counts[first] > 0) & (counts[second] > 0)
+            return day_vars[first[both]] + day_vars[second[both]]
+        
+        oncall_by_day = by_day(oncall_post_mask)
+        doc_day_start = np.arange(len(D))[:, None] * n_days
+        
+        # Rest: one row per (doctor, adjacent day pair) with on-call work on both days.
+        # On a Sat->Sun Standby weekend only the non-Standby posts count (pairing covers Standby),
+        # so those pairs read from the second half of the stacked by-day matrix
+        standby_weekend = (weekday_arr[:-1] == 5) & (weekday_arr[1:] == 6)
+        if standby_t is not None:
+            standby_weekend &= post_valid[:-1, standby_t] & post_valid[1:, standby_t]
+        else:
+            standby_weekend[:] = False
+        rest_day_vars = sp.vstack([oncall_by_day, by_day(oncall_non_standby_mask)], format="csr")
+        rest_today = (doc_day_start + np.arange(n_days - 1)[None, :]
+                      + standby_weekend[None, :] * len(D) * n_days).ravel()
+        rest_matrix = paired_rows(rest_day_vars, rest_today, rest_today + 1)
+        
+        # Gap: one row per (doctor, day) with on-call work on both day and day+2
+        gap_today = (doc_day_start + np.arange(max(n_days - 2, 0))[None, :]).ravel()
+        gap_matrix = paired_rows(oncall_by_day, gap_today, gap_today + 2)
+        
+        # Minimum one assignment: one row per non-floater (possibly empty)
+        min_one_docs = [d for d, code in zip(D, category_code) if code != FLOATER]
+        min_one_rows = [existing(var_id[doc_idx[d]].ravel()) for d in min_one_docs]
+        
+        # Unit over-coverage (25% soft cap): one row per (unit, non-clinic day) with any assignment.
+        # Each X entry counts toward its doctor's unit on its day unless that is a unit clinic day
+        no_clinic = np.zeros(n_days, dtype=np.bool_)
+        unit_non_clinic = np.array([~unit_clinic_day.get(u, no_clinic) for u in units], dtype=np.bool_).reshape(len(units), n_days)
+        var_unit = doc_unit_id[var_d]
+        counted = np.flatnonzero(var_unit >= 0)
+        counted = counted[unit_non_clinic[var_unit[counted], var_s[counted]]]
+        over_groups, over_row = np.unique(var_unit[counted] * n_days + var_s[counted], return_inverse=True)
+        over_matrix = sp.csr_matrix((np.ones(len(counted)), (over_row, counted)), shape=(len(over_groups), n_vars))
+        unit_caps = np.array([max(1, math.ceil(0.25 * len(unit_doc_idx[u]))) for u in units], dtype=np.int64)
+        over_caps = unit_caps[over_groups // n_days]
+        
+        # === LINEAR PENALTIES ===
+        # Every per-assignment penalty is a lambda times the X entries picked by a
+        # (doctor, day, post) mask. The masks are built by broadcasting doctor category,
+        # clinic-day, weekday and post masks, and read off at the available slots
+        # Per-unit values are looked up by doc_unit_id; the trailing entry serves index -1
+        doc_clinic_mask = np.array([clinic_day_mask[u] for u in units] + [0], dtype=np.int64)[doc_unit_id]
+        
+        # clinic_day[d, s]: day s is a clinic day of doctor d's unit
+        clinic_day = ((doc_clinic_mask[:, None] >> weekday_arr[None, :]) & 1).astype(np.bool_)
+        before_clinic = np.zeros_like(clinic_day)
+        before_clinic[:, :-1] = clinic_day[:, 1:]
+        after_clinic = np.zeros_like(clinic_day)
+        after_clinic[:, 1:] = clinic_day[:, :-1]
+        
+        # Workload-based Standby Oncall multiplier per doctor, from the first rule that applies:
+        # HEAVY penalty if doctor has done Standby in last 12 months (make it very unlikely),
+        # medium penalty for recent standby (3 months), a recency penalty (more recent = higher),
+        # or a reward for doctors who haven't done standby in a long time (never below 1)
+        standby_12m = workload_df["standby_count_12m"].to_numpy(dtype=np.float64)
+        standby_3m = workload_df["standby_count_3m"].to_numpy(dtype=np.float64)
+        days_since = workload_df["days_since_last_standby"].to_numpy(dtype=np.float64)
+        standby_multiplier = np.select(
+            [standby_12m > 0, standby_3m > 0, days_since < 365, days_since > 365],
+            [lambda_standby + 5000,
+             lambda_standby + 2000,
+             lambda_standby + np.maximum(0, (365 - days_since) * 5),
+             np.maximum(1, lambda_standby - np.minimum(200, (days_since - 365) / 5))],
+            default=lambda_standby,
+        )
+        logger.debug(f"Heavy Standby penalty for {int((standby_12m > 0).sum())} doctors with standby in 12m")
+        
+        penalty_masks = {}
+        
+        # Clinic day penalties: oncall work the day before/of/after the doctor's clinic day
+        # Also penalize doing clinic for other units on this doctor's clinic day
+        own_clinic_t = np.array([post_idx[f"clinic:{u}"] for u in units] + [-1], dtype=np.int64)[doc_unit_id]
+        other_unit_clinic = ((clinic_post_mask & ~oncall_post_mask)[None, :]
+                             & (np.arange(len(all_posts))[None, :] != own_clinic_t[:, None]))
+        penalty_masks["clinic_before"] = before_clinic[:, :, None] & oncall_post_mask[None, None, :]
+        penalty_masks["clinic_same"] = clinic_day[:, :, None] & (oncall_post_mask[None, :] | other_unit_clinic)[:, None, :]
+        penalty_masks["clinic_after"] = after_clinic[:, :, None] & oncall_post_mask[None, None, :]
+        
+        # Registrar weekend penalty (Standby is not double-penalized)
+        penalty_masks["reg_weekend"] = (
+            (category_code == REGISTRAR)[:, None, None]
+            & (weekday_arr >= 5)[None, :, None]
+            & oncall_non_standby_mask[None, None, :]
+        )
+        
+        # Junior ward penalty
+        ward_post_mask = np.array([t.startswith("Ward") for t in all_posts], dtype=np.bool_)
+        penalty_masks["junior_ward"] = (category_code == JUNIOR)[:, None, None] & ward_post_mask[None, None, :]
+        
+        # ED assignment penalties (seniors/registrars prefer not to do ED)
+        ed_post_mask = np.array([t.startswith("ED") for t in all_posts], dtype=np.bool_)
+        penalty_masks["ed"] = np.isin(category_code, [SENIOR, REGISTRAR])[:, None, None] & ed_post_mask[None, None, :]
+        
+        penalty_vectors = {
+            name: np.broadcast_to(mask, availability.shape)[availability].astype(np.float64)
+            for name, mask in penalty_masks.items()
+        }
+        penalty_lambdas = {
+            "clinic_before": lambda_before_clinic,
+            "clinic_same": lambda_same_clinic,
+            "clinic_after": lambda_after_clinic,
+            "reg_weekend": lambda_reg_weekend,
+            "junior_ward": lambda_junior_ward,
+            "ed": lambda_ED,
+        }
+        
+        # Standby Oncall X entries summed per doctor, weighted by the doctor's multiplier
+        standby_by_doctor = _indicator_matrix([
+            existing(var_id[d, :, standby_t]) if standby_t is not None else []
+            for d in range(len(D))
+        ], n_vars)
+        
+        # All linear penalties as one weighted sum: penalty_weights @ (penalty_matrix @ X),
+        # one row per penalty mask followed by one Standby row per doctor
+        penalty_matrix = sp.vstack(
+            [sp.csr_matrix(vector) for vector in penalty_vectors.values()] + [standby_by_doctor], format="csr"
+        )
+        penalty_weights = np.concatenate([
+            [penalty_lambdas[name] for name in penalty_vectors], standby_multiplier
+        ]).astype(np.float64)
+        
+        # Prefer Gurobi (when licensed) or HiGHS for the MILP; fall back to CBC. Every
+        # solver stops at the time limit or once the incumbent is within mip_gap of the bound
+        installed_solvers = cp.installed_solvers()
+        if 'GUROBI' in installed_solvers:
+            # Threads split this run's cores between the solves running at once
+            solver_name, solver_opts = cp.GUROBI, {
+                "TimeLimit": float(solver_timeout), "MIPGap": mip_gap,
+                "Threads": max(1, cores // (2 if parallel_phases else 1))
+            }
+        elif 'HIGHS' in installed_solvers:
+            solver_name, solver_opts = cp.HIGHS, {"time_limit": float(solver_timeout), "mip_rel_gap": mip_gap}
+        elif 'CBC' in installed_solvers:
+            solver_name, solver_opts = cp.CBC, {"maximumSeconds": solver_timeout, "allowableFractionGap": mip_gap}
+        else:
+            raise Exception("Gurobi, HiGHS or CBC solver is required but none is installed")
+        # Gurobi and HiGHS can seed branch-and-bound with the last solution found on this problem
+        # (Phase 1's incumbent, or the previous run on a cached model); infeasible seeds are dropped
+        warm_start = solver_name in (cp.GUROBI, cp.HIGHS)
+        
+        # Canonicalization, not the MILP solve, dominates large rosters, so it uses
+        # the SciPy sparse backend and is done once per model structure
+        canon_opts = dict(canon_backend=cp.SCIPY_CANON_BACKEND)
+        
+        # Sparse constraint matrices, one row per constraint. Together with the standby
+        # index arrays and unit caps they fix the model's structure; the weights are Parameters
+        matrices = {name: var_rows(rows) for name, rows in (
+            ("coverage", coverage_rows), ("clinic_cover", clinic_cover_rows),
+            ("day", day_rows), ("clinic_day", clinic_day_rows),
+            ("min_one", min_one_rows)
+        )}
+        matrices["rest"], matrices["gap"], matrices["over"] = rest_matrix, gap_matrix, over_matrix
+        
+        def model_structure_key():
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(np.array([n_vars, len(D), len(weekend_pairs)], dtype=np.int64).tobytes())
+            for name, matrix in matrices.items():
+                digest.update(name.encode())
+                digest.update(matrix.indptr.tobytes())
+                digest.update(matrix.indices.tobytes())
+            for arr in (standby_linked, standby_unlinked, over_caps,
+                        penalty_matrix.indptr, penalty_matrix.indices):
+                digest.update(arr.tobytes())
+            return digest.hexdigest()
+        
+        # Helper that builds the model shared by both phases. The phase and the penalty
+        # weights are Parameters, so switching from Phase 1 to Phase 2, or re-running the
+        # same roster with new weights, reuses the compiled problem
+        def build_model():
+            params = {
+                "penalty": cp.Parameter(penalty_matrix.shape[0]),
+                "big_m": cp.Parameter(),
+                "rest": cp.Parameter(),
+                "min_one": cp.Parameter(),
+                "gap": cp.Parameter(),
+                "unit_over": cp.Parameter(),
+                # relax = 0 in Phase 1 (strict), 1 in Phase 2 (Big-M slack)
+                "relax": cp.Parameter(nonneg=True),
+            }
+            relax = params["relax"]
+            
             # === Decision variables ===
-            x = {(d, s, t): cp.Variable(boolean=True)
-                 for d in D for s in S for t in posts_by_day[s]
-                 if availability.get((d, s, t), False)}  # Only create vars where available
+            X = cp.Variable(n_vars, boolean=True)
             
             # === STANDBY WEEKEND BINARY INDICATORS ===
             # y[d, w] = 1 if doctor d is assigned Standby for weekend w (both Sat and Sun)
-            y = {(d, w): cp.Variable(boolean=True) 
-                 for d in D for w in range(len(weekend_pairs))}
+            y = cp.Variable((len(D), len(weekend_pairs)), boolean=True)
+            y_flat = cp.vec(y, order="C")
             
             # === Soft constraint variables ===
-            rest_violation = {(d, s): cp.Variable(boolean=True)
-                              for d in D for s in range(len(date_list) - 1)}  # ALL adjacent pairs
-            z_gap = {(d, s): cp.Variable(boolean=True)
-                     for d in D for s in S if s <= len(date_list) - 3}
-            min_one_slack = {d: cp.Variable(boolean=True)
-                             for d in D if doctor_info[d]["category"] != "floater"}
-            
-            # Multiple weekend penalty variables
-            multiple_weekend_penalty = {d: cp.Variable(nonneg=True) for d in D}
+            # One entry per rest / gap / min-one row built above
+            rest_violation = cp.Variable(rest_matrix.shape[0], boolean=True)
+            z_gap = cp.Variable(gap_matrix.shape[0], boolean=True)
+            min_one_slack = cp.Variable(len(min_one_rows), boolean=True)
             
             # Initialize penalty terms
             penalty_terms = []
+            if penalty_matrix.nnz:
+                penalty_terms.append(params["penalty"] @ (penalty_matrix @ X))
             
             # === CONSTRAINTS ===
             constraints = []
             
             # === HARD/SOFT SPLIT by phase ===
-            if RELAX:
-                logger.info("Phase 2: Relaxed constraints with Big-M penalties")
-                # Each post should be covered (soft with slack)
-                for s in S:
-                    for t in posts_by_day[s]:
-                        assigned_vars = [x[d, s, t] for d in D if (d, s, t) in x]
-                        if assigned_vars:
-                            slack = cp.Variable(nonneg=True)
-                            penalty_terms.append(BIG_M * slack)
-                            constraints.append(cp.sum(assigned_vars) + slack >= 1)
-            else:
-                logger.info("Phase 1: Strict constraints")
-                # Each post must be covered (hard)
-                for s in S:
-                    for t in posts_by_day[s]:
-                        assigned_vars = [x[d, s, t] for d in D if (d, s, t) in x]
-                        if assigned_vars:
-                            constraints.append(cp.sum(assigned_vars) == 1)
+            # Each post should be covered, and each unit should have exactly 1 doctor
+            # assigned to clinic on each clinic day. In Phase 1 the slack is pinned to 0
+            # and the upper bound makes each sum exactly 1 (hard); in Phase 2 the upper
+            # bound is slack and coverage is sum + slack >= 1 (soft)
+            for cover in (matrices["coverage"], matrices["clinic_cover"]):
+                if not cover.shape[0]:
+                    continue
+                row_sizes = np.asarray(cover.sum(axis=1)).ravel()
+                slack = cp.Variable(cover.shape[0], nonneg=True)
+                penalty_terms.append(params["big_m"] * cp.sum(slack))
+                constraints.append(cover @ X + slack >= 1)
+                constraints.append(slack <= relax)
+                constraints.append(cover @ X <= 1 + relax * row_sizes)
             
             # Each doctor works at most one post per day (always hard)
-            for d in D:
-                for s in S:
-                    day_vars = [x[d, s, t] for t in posts_by_day[s] if (d, s, t) in x]
-                    if day_vars:
-                        constraints.append(cp.sum(day_vars) <= 1)
+            if day_rows:
+                constraints.append(matrices["day"] @ X <= 1)
             
-            # === CLINIC ASSIGNMENT CONSTRAINTS ===
-            
-            # 1. Uniqueness constraint: Each doctor can do at most 1 clinic per day (across all units)
-            for d in D:
-                for s in S:
-                    clinic_vars = [x[d, s, t] for t in posts_by_day[s] if t.startswith("clinic:") and (d, s, t) in x]
-                    if clinic_vars:
-                        constraints.append(cp.sum(clinic_vars) <= 1)
-            
-            # 2. Coverage constraint: Each unit must have exactly 1 doctor assigned to clinic on each clinic day
-            for u, weekdays in clinic_days.items():
-                clinic_post = f"clinic:{u}"
-                unit_docs = [d for d in D if doctor_info[d]["unit"] == u]
-                
-                for s, date in enumerate(date_list):
-                    if date.weekday() in weekdays and clinic_post in posts_by_day[s]:
-                        clinic_vars = [x[d, s, clinic_post] for d in unit_docs if (d, s, clinic_post) in x]
-                        if clinic_vars:
-                            if RELAX:
-                                # Soft constraint with slack for clinic coverage
-                                clinic_slack = cp.Variable(nonneg=True)
-                                penalty_terms.append(BIG_M * clinic_slack)
-                                constraints.append(cp.sum(clinic_vars) + clinic_slack >= 1)
-                            else:
-                                # Hard constraint: exactly 1 doctor from unit must do clinic
-                                constraints.append(cp.sum(clinic_vars) == 1)
+            # Each doctor can do at most 1 clinic per day (across all units)
+            if clinic_day_rows:
+                constraints.append(matrices["clinic_day"] @ X <= 1)
             
             # === LINEAR STANDBY ONCALL WEEKEND CONSTRAINTS ===
-            
-            # 1. Link weekend binary indicators to Saturday/Sunday assignments via AND linearization
-            for w, (sat_day, sun_day) in enumerate(weekend_pairs):
-                for d in D:
-                    if (d, w) in y:
-                        # Standard AND linearization: y[d,w] = 1 iff both Sat and Sun assignments = 1
-                        sat_var = x.get((d, sat_day, "Standby Oncall"), None)
-                        sun_var = x.get((d, sun_day, "Standby Oncall"), None)
-                        
-                        if sat_var is not None and sun_var is not None:
-                            # y[d,w] <= x[d,sat] and y[d,w] <= x[d,sun]  
-                            constraints.append(y[d, w] <= sat_var)
-                            constraints.append(y[d, w] <= sun_var)
-                            # y[d,w] >= x[d,sat] + x[d,sun] - 1
-                            constraints.append(y[d, w] >= sat_var + sun_var - 1)
-                        else:
-                            # If doctor not available for both days, y[d,w] = 0
-                            constraints.append(y[d, w] == 0)
-            
-            # 2. Enforce Saturday = Sunday pairing via two linear inequalities  
-            for w, (sat_day, sun_day) in enumerate(weekend_pairs):
-                sat_assignments = [x[d, sat_day, "Standby Oncall"] for d in D if (d, sat_day, "Standby Oncall") in x]
-                sun_assignments = [x[d, sun_day, "Standby Oncall"] for d in D if (d, sun_day, "Standby Oncall") in x]
+            if weekend_pairs:
+                # 1. Same doctor must do both Saturday and Sunday, so the weekend indicator
+                # is just the Saturday assignment (the AND of Sat and Sun would be redundant)
+                if len(standby_linked):
+                    y_idx, sat_i, sun_i = standby_linked.T
+                    constraints.append(X[sat_i] == X[sun_i])
+                    constraints.append(y_flat[y_idx] == X[sat_i])
+                if len(standby_unlinked):
+                    # If doctor not available for both days, y[d,w] = 0
+                    constraints.append(y_flat[standby_unlinked] == 0)
                 
-                if sat_assignments and sun_assignments:
-                    # Same doctor must do both Saturday and Sunday
-                    for d in D:
-                        sat_var = x.get((d, sat_day, "Standby Oncall"), None)
-                        sun_var = x.get((d, sun_day, "Standby Oncall"), None)
-                        if sat_var is not None and sun_var is not None:
-                            constraints.append(sat_var == sun_var)  # Same doctor both days
-            
-            # 3. Cooldown constraint: y[d,w] + y[d,w+1] <= 1 (no consecutive weekends)
-            for d in D:
-                for w in range(len(weekend_pairs) - 1):
-                    if (d, w) in y and (d, w+1) in y:
-                        constraints.append(y[d, w] + y[d, w+1] <= 1)
-            
-            # 4. Monthly cap: at most 1 Standby weekend per doctor per period
-            for d in D:
-                weekend_vars = [y[d, w] for w in range(len(weekend_pairs)) if (d, w) in y]
-                if weekend_vars:
-                    constraints.append(cp.sum(weekend_vars) <= 1)
-            
-            # 5. Multiple weekend penalty: k[d] >= sum(y[d,w]) - 1
-            for d in D:
-                weekend_vars = [y[d, w] for w in range(len(weekend_pairs)) if (d, w) in y]
-                if weekend_vars and d in multiple_weekend_penalty:
-                    constraints.append(multiple_weekend_penalty[d] >= cp.sum(weekend_vars) - 1)
-                    penalty_terms.append(1000 * multiple_weekend_penalty[d])  # Penalty for 2nd+ weekend
-            
-            # === FIXED: REST CONSTRAINTS (corrected from >= 1 to <= 1 + slack) ===
-            for d in D:
-                for s in range(len(date_list) - 1):  # All adjacent pairs
-                    oncall_today = [x[d, s, t] for t in posts_by_day[s] 
-                                   if t in oncall_posts and (d, s, t) in x]
-                    oncall_tomorrow = [x[d, s+1, t] for t in posts_by_day[s+1] 
-                                      if t in oncall_posts and (d, s+1, t) in x]
-                    
-                    if oncall_today and oncall_tomorrow:
-                        # Check if this is a Standby weekend pair (already handled above)
-                        is_standby_weekend = (
-                            date_list[s].weekday() == 5 and date_list[s+1].weekday() == 6 and
-                            any(t == "Standby Oncall" for t in posts_by_day[s]) and
-                            any(t == "Standby Oncall" for t in posts_by_day[s+1])
-                        )
-                        
-                        if is_standby_weekend:
-                            # Standby weekend rest is handled by the pairing constraint above
-                            # Only apply rest constraint to non-Standby posts
-                            non_standby_today = [x[d, s, t] for t in posts_by_day[s] 
-                                               if t in oncall_posts and t != "Standby Oncall" and (d, s, t) in x]
-                            non_standby_tomorrow = [x[d, s+1, t] for t in posts_by_day[s+1] 
-                                                  if t in oncall_posts and t != "Standby Oncall" and (d, s+1, t) in x]
-                            
-                            if non_standby_today and non_standby_tomorrow:
-                                if (d, s) in rest_violation:
-                                    # FIXED: Soft constraint sum(today) + sum(tomorrow) <= 1 + violation
-                                    constraints.append(
-                                        cp.sum(non_standby_today) + cp.sum(non_standby_tomorrow) <= 1 + rest_violation[d, s]
-                                    )
-                                    penalty_terms.append(lambda_rest * rest_violation[d, s])
-                                else:
-                                    # Hard constraint 
-                                    constraints.append(cp.sum(non_standby_today) + cp.sum(non_standby_tomorrow) <= 1)
-                        else:
-                            # Regular rest constraint for all non-weekend-Standby adjacent pairs
-                            if (d, s) in rest_violation:
-                                # FIXED: Corrected constraint sum(today) + sum(tomorrow) <= 1 + violation
-                                constraints.append(
-                                    cp.sum(oncall_today) + cp.sum(oncall_tomorrow) <= 1 + rest_violation[d, s]
-                                )
-                                penalty_terms.append(lambda_rest * rest_violation[d, s])
-                            else:
-                                # Hard constraint
-                                constraints.append(cp.sum(oncall_today) + cp.sum(oncall_tomorrow) <= 1)
-            
-            # === CLINIC DAY PENALTIES ===
-            # Penalize oncall assignments before/same/after clinic days
-            for d in D:
-                unit = doctor_info[d]["unit"]
-                days_for_unit = clinic_days.get(unit, [])
-                for s, date in enumerate(date_list):
-                    if date.weekday() in days_for_unit:
-                        for delta in (-1, 0, 1):
-                            idx = s + delta
-                            if 0 <= idx < len(date_list):
-                                for t in posts_by_day[idx]:
-                                    # Apply penalties to oncall posts (not clinic posts themselves)
-                                    if t in oncall_posts and (d, idx, t) in x:
-                                        if delta == -1:
-                                            penalty_terms.append(lambda_before_clinic * x[d, idx, t])
-                                        elif delta == 0:
-                                            penalty_terms.append(lambda_same_clinic * x[d, idx, t])
-                                        else:  # +1
-                                            penalty_terms.append(lambda_after_clinic * x[d, idx, t])
-                                    # Also penalize doing clinic for other units on this doctor's clinic day
-                                    elif t.startswith("clinic:") and t != f"clinic:{unit}" and (d, idx, t) in x:
-                                        if delta == 0:  # Same day penalty for wrong unit clinic
-                                            penalty_terms.append(lambda_same_clinic * x[d, idx, t])
-            
-            # === WORKLOAD-BASED STANDBY ONCALL PENALTIES ===
-            
-            # Apply penalties based on historical workload and recency 
-            for d in D:
-                wd = workload_data.get(d, {
-                    "standby_count_12m": 0,
-                    "standby_count_3m": 0,
-                    "days_since_last_standby": 9999
-                })
+                # 3. Cooldown constraint: y[d,w] + y[d,w+1] <= 1 (no consecutive weekends)
+                if len(weekend_pairs) > 1:
+                    constraints.append(y[:, :-1] + y[:, 1:] <= 1)
                 
-                # Calculate penalty multiplier based on workload history
-                penalty_multiplier = lambda_standby  # Base penalty
+                # 4. Monthly cap: at most 1 Standby weekend per doctor per period
+                weekends_per_doctor = cp.sum(y, axis=1)
+                constraints.append(weekends_per_doctor <= 1)
                 
-                # HEAVY penalty if doctor has done Standby in last 12 months
-                if wd['standby_count_12m'] > 0:
-                    penalty_multiplier += 5000  # Make it very unlikely
-                    logger.debug(f"Heavy penalty for {d}: {wd['standby_count_12m']} standby in 12m")
-                
-                # Medium penalty for recent standby (3 months)
-                elif wd['standby_count_3m'] > 0:
-                    penalty_multiplier += 2000
-                
-                # Penalty based on recency (more recent = higher penalty)
-                elif wd['days_since_last_standby'] < 365:
-                    recency_penalty = max(0, (365 - wd['days_since_last_standby']) * 5)
-                    penalty_multiplier += recency_penalty
-                
-                # Reward doctors who haven't done standby in a long time
-                elif wd['days_since_last_standby'] > 365:
-                    reward = min(200, (wd['days_since_last_standby'] - 365) / 5)
-                    penalty_multiplier = max(1, penalty_multiplier - reward)  # Don't go negative
-                
-                # Apply penalty to all Standby assignments for this doctor
-                standby_vars = [x[d, s, t] for s in S for t in posts_by_day[s] 
-                               if t == "Standby Oncall" and (d, s, t) in x]
-                for var in standby_vars:
-                    penalty_terms.append(penalty_multiplier * var)
-            
-            # === OTHER PENALTIES ===
+                # 5. Multiple weekend penalty: k[d] >= sum(y[d,w]) - 1
+                multiple_weekend_penalty = cp.Variable(len(D), nonneg=True)
+                constraints.append(multiple_weekend_penalty >= weekends_per_doctor - 1)
+                penalty_terms.append(1000 * cp.sum(multiple_weekend_penalty))  # Penalty for 2nd+ weekend
             
-            # Registrar weekend penalty
-            for (d, s, t) in x.keys():
-                if (doctor_info[d]["category"] == "registrar" 
-                    and date_list[s].weekday() >= 5 
-                    and t in oncall_posts
-                    and t != "Standby Oncall"):  # Don't double-penalize standby
-                    penalty_terms.append(lambda_reg_weekend * x[d, s, t])
-            
-            # Junior ward penalty
-            for (d, s, t) in x.keys():
-                if (doctor_info[d]["category"] == "junior" 
-                    and t.startswith("Ward")):
-                    penalty_terms.append(lambda_junior_ward * x[d, s, t])
-            
-            # ED assignment penalties (seniors/registrars prefer not to do ED)
-            for (d, s, t) in x.keys():
-                if (doctor_info[d]["category"] in ["senior", "registrar"] 
-                    and t.startswith("ED")):
-                    penalty_terms.append(lambda_ED * x[d, s, t])
+            # === REST CONSTRAINTS: sum(today) + sum(tomorrow) <= 1 + violation ===
+            if rest_matrix.shape[0]:
+                constraints.append(matrices["rest"] @ X <= 1 + rest_violation)
+                penalty_terms.append(params["rest"] * cp.sum(rest_violation))
             
             # Minimum one assignment for non-floaters
-            for d in D:
-                if doctor_info[d]["category"] != "floater" and d in min_one_slack:
-                    total_assignments = cp.sum([x[d, s, t] for s in S for t in posts_by_day[s] if (d, s, t) in x])
-                    constraints.append(total_assignments + min_one_slack[d] >= 1)
-                    penalty_terms.append(lambda_min_one * min_one_slack[d])
+            if min_one_rows:
+                constraints.append(matrices["min_one"] @ X + min_one_slack >= 1)
+                penalty_terms.append(params["min_one"] * cp.sum(min_one_slack))
             
-            # Gap penalties (reward 3-day gaps)
-            for d in D:
-                for s in range(len(date_list) - 2):
-                    if (d, s) in z_gap:
-                        oncall_today = [x[d, s, t] for t in posts_by_day[s] if t in oncall_posts and (d, s, t) in x]
-                        oncall_plus3 = [x[d, s+2, t] for t in posts_by_day[s+2] if t in oncall_posts and (d, s+2, t) in x]
-                        
-                        if oncall_today and oncall_plus3:
-                            # z_gap[d,s] = 1 if both today and +2 days have oncall assignments
-                            constraints.append(z_gap[d, s] >= cp.sum(oncall_today) + cp.sum(oncall_plus3) - 1)
-                            penalty_terms.append(-lambda_gap * z_gap[d, s])  # Negative = reward
+            # Gap penalties (reward 3-day gaps):
+            # z_gap[d,s] = 1 if both today and +2 days have oncall assignments
+            if gap_matrix.shape[0]:
+                constraints.append(z_gap >= matrices["gap"] @ X - 1)
+                penalty_terms.append(-params["gap"] * cp.sum(z_gap))  # Negative = reward
             
             # Unit over-coverage penalty (25% soft cap)
-            for u in units:
-                unit_docs = unit_to_docs[u]
-                if len(unit_docs) > 0:
-                    cap = max(1, math.ceil(0.25 * len(unit_docs)))
-                    for s, date in enumerate(date_list):
-                        if date.weekday() not in clinic_days.get(u, []):  # Non-clinic days
-                            unit_assignments = [x[d, s, t] for d in unit_docs for t in posts_by_day[s] if (d, s, t) in x]
-                            if unit_assignments:
-                                over_slack = cp.Variable(nonneg=True)
-                                constraints.append(cp.sum(unit_assignments) - over_slack <= cap)
-                                penalty_terms.append(lambda_unit_over * over_slack)
+            if over_matrix.shape[0]:
+                over_slack = cp.Variable(over_matrix.shape[0], nonneg=True)
+                constraints.append(over_matrix @ X - over_slack <= over_caps)
+                penalty_terms.append(params["unit_over"] * cp.sum(over_slack))
             
             # === OBJECTIVE ===
             if penalty_terms:
                 objective = cp.Minimize(cp.sum(penalty_terms))
             else:
                 # Fallback objective
-                total_assignments = cp.sum([x[d, s, t] for (d, s, t) in x.keys()])
-                objective = cp.Minimize(total_assignments)
+                objective = cp.Minimize(cp.sum(X))
             
-            # === SOLVE ===
             problem = cp.Problem(objective, constraints)
-            logger.info(f"Problem has {len(x)} variables, {len(constraints)} constraints")
-            
-            # Use CBC solver exclusively
-            if 'CBC' not in cp.installed_solvers():
-                raise Exception("CBC solver is required but not installed")
-            
-            logger.info("Solving with CBC solver...")
-            problem.solve(solver=cp.CBC, verbose=False, maximumSeconds=solver_timeout)
+            logger.info(f"Problem has {n_vars} variables, {len(constraints)} constraints")
+            return {"problem": problem, "X": X, "y": y, "params": params}
+        
+        structure_key = model_structure_key()
+        model = _model_cache.pop(structure_key, None)
+        if model is None:
+            model = build_model()
+        else:
+            logger.info("Reusing compiled model for an identical roster structure")
+        _model_cache[structure_key] = model
+        while len(_model_cache) > MODEL_CACHE_SIZE:
+            _model_cache.popitem(last=False)
+        
+        problem, X, y, params = model["problem"], model["X"], model["y"], model["params"]
+        relax = params["relax"]
+        params["penalty"].value = penalty_weights
+        params["big_m"].value = BIG_M
+        params["rest"].value = lambda_rest
+        params["min_one"].value = lambda_min_one
+        params["gap"].value = lambda_gap
+        params["unit_over"].value = lambda_unit_over
+        
+        def solve_phase(RELAX: bool):
+            logger.info("Phase 2: Relaxed constraints with Big-M penalties" if RELAX else "Phase 1: Strict constraints")
+            relax.value = 1.0 if RELAX else 0.0
+            
+            logger.info(f"Solving with {solver_name} solver...")
+            problem.solve(solver=solver_name, verbose=False, warm_start=warm_start, **solver_opts, **canon_opts)
             
             logger.info(f"Solver status: {problem.status}")
             if problem.value is not None:
                 logger.info(f"Objective value: {problem.value}")
             
-            return problem, x, y  # Return weekend binary indicators instead of mismatch penalties
+            # Return weekend binary indicators instead of mismatch penalties
+            return PhaseResult(problem.status, problem.value, X.value, y.value)
+        
+        def solve_phase_in_child(RELAX: bool, conn):
+            """Forked-process entry point: solve one phase and send back its PhaseResult"""
+            try:
+                conn.send(solve_phase(RELAX))
+            except Exception as e:
+                conn.send(e)
+            finally:
+                conn.close()
+        
+        def start_phase(RELAX: bool):
+            # fork shares the model data with the child; only the result is pickled back
+            fork_context = multiprocessing.get_context('fork')
+            receiver, sender = fork_context.Pipe(duplex=False)
+            process = fork_context.Process(
+                target=solve_phase_in_child, args=(RELAX, sender), daemon=True
+            )
+            process.start()
+            sender.close()
+            return process, receiver
+        
+        def collect_phase(phase):
+            process, receiver = phase
+            try:
+                result = receiver.recv()
+            except EOFError:
+                raise Exception("Solver process exited without a result")
+            finally:
+                receiver.close()
+                process.join()
+            if isinstance(result, Exception):
+                raise result
+            return result
         
         # --------------------------------------------------------------------------------
         # RUN PHASE 1 (strict constraints)
-        logger.info("Starting Phase 1...")
-        problem1, x1, y1 = build_and_solve(RELAX=False)
+        report_progress(0.5)
+        if parallel_phases:
+            # Phase 2 is only used when Phase 1 fails, so it runs speculatively
+            # and is stopped as soon as Phase 1 comes back optimal
+            logger.info("Starting Phase 1 and Phase 2 in parallel...")
+            # Compile before forking so both children reuse the canonicalization
+            relax.value = 0.0
+            problem.get_problem_data(solver_name, **canon_opts)
+            phase1, phase2 = start_phase(RELAX=False), start_phase(RELAX=True)
+            try:
+                result1 = collect_phase(phase1)
+            except Exception:
+                phase2[0].terminate()
+                raise
+        else:
+            logger.info("Starting Phase 1...")
+            result1 = solve_phase(RELAX=False)
+        report_progress(0.6)
         
-        if problem1.status == cp.OPTIMAL:
+        if result1.status == cp.OPTIMAL:
             logger.info("Phase 1 succeeded - using optimal solution")
-            final_problem, final_x, final_y = problem1, x1, y1
+            final = result1
+            if parallel_phases:
+                phase2[0].terminate()
+                phase2[0].join()
+                phase2[1].close()
         else:
             logger.info("Phase 1 failed - running Phase 2...")
-            problem2, x2, y2 = build_and_solve(RELAX=True)
-            final_problem, final_x, final_y = problem2, x2, y2
+            final = collect_phase(phase2) if parallel_phases else solve_phase(RELAX=True)
+            report_progress(0.8)
         
         # === EXTRACT RESULTS ===
         results = []
+        weekend_assignments = []
+        posts_filled, assignments_by_date, workload_by_doctor = Counter(), Counter(), Counter()
         
-        if final_problem.status in [cp.OPTIMAL, cp.OPTIMAL_INACCURATE]:
+        if final.status in [cp.OPTIMAL, cp.OPTIMAL_INACCURATE]:
             # Log weekend binary indicator results
-            weekend_assignments = []
-            for d in D:
-                for w in range(len(weekend_pairs)):
-                    if (d, w) in final_y and final_y[d, w].value is not None and final_y[d, w].value > 0.5:
-                        weekend_assignments.append((d, w, weekend_pairs[w]))
+            if weekend_pairs:
+                weekend_assignments = [(D[d_i], w, weekend_pairs[w]) for d_i, w in np.argwhere(final.y > 0.5).tolist()]
             
-            if weekend_assignments:
+            # Per-assignment diagnostics are skipped entirely unless INFO is enabled
+            log_details = logger.isEnabledFor(logging.INFO)
+            if weekend_assignments and log_details:
                 logger.info(f"Weekend Standby assignments: {len(weekend_assignments)}")
                 for d, w, (sat_day, sun_day) in weekend_assignments:
                     logger.info(f"  Doctor {d} -> Weekend {w} ({date_list[sat_day]} to {date_list[sun_day]})")
             
             # Extract assignments with deduplication for clinic posts
             assignment_map = {}  # (doctor, date) -> post
-            for (d, s, t), var in final_x.items():
-                if var.value is not None and var.value > 0.5:  # Binary variable threshold
-                    current_date = date_list[s]
-                    date_str = current_date.isoformat()
-                    
-                    if t.startswith("clinic:"):
-                        # For clinic posts, dedupe by (doctor, date) - only keep one clinic per doctor per day
-                        key = (d, date_str)
-                        if key not in assignment_map or not assignment_map[key].startswith("clinic:"):
-                            assignment_map[key] = t
-                    else:
-                        # For non-clinic posts, just add them
-                        results.append({
-                            "doctor": d,
-                            "date": date_str,
-                            "post": t
-                        })
+            date_strs = [date.isoformat() for date in date_list]
+            assigned = np.flatnonzero(final.x > 0.5)  # Binary variable threshold
+            for d_i, s, t_i in zip(var_d[assigned].tolist(), var_s[assigned].tolist(), var_t[assigned].tolist()):
+                d, t, date_str = D[d_i], all_posts[t_i], date_strs[s]
+                
+                if clinic_post_mask[t_i]:
+                    # For clinic posts, dedupe by (doctor, date) - only keep one clinic per doctor per day
+                    key = (d, date_str)
+                    if key not in assignment_map or not assignment_map[key].startswith("clinic:"):
+                        assignment_map[key] = t
+                else:
+                    # For non-clinic posts, just add them
+                    results.append({
+                        "doctor": d,
+                        "date": date_str,
+                        "post": t
+                    })
             
             # Add deduplicated clinic assignments to results
             for (doctor, date), post in assignment_map.items():
@@ -675,90 +824,64 @@ def run_prime_scheduler(config: Dict[str, Any]) -> Dict[str, Any]:
             
             logger.info(f"Generated schedule with {len(results)} assignments")
             
-            # Log assignment breakdown by type
-            assignment_counts = {}
-            clinic_assignments = []
-            standby_assignments = []
-            
+            # Tally assignments by post/date/doctor and split out clinic and Standby in one pass
+            clinic_assignments, standby_assignments = [], []
             for assignment in results:
-                post = assignment["post"]
-                if post.startswith("clinic:"):
+                posts_filled[assignment["post"]] += 1
+                assignments_by_date[assignment["date"]] += 1
+                workload_by_doctor[assignment["doctor"]] += 1
+                if assignment["post"].startswith("clinic:"):
                     clinic_assignments.append(assignment)
-                elif post == "Standby Oncall":
+                elif assignment["post"] == "Standby Oncall":
                     standby_assignments.append(assignment)
-                
-                assignment_counts[post] = assignment_counts.get(post, 0) + 1
             
-            logger.info(f"Assignment breakdown: {assignment_counts}")
-            logger.info(f"Clinic assignments: {len(clinic_assignments)} (distinct unit/date pairs)")
-            logger.info(f"Standby Oncall assignments: {len(standby_assignments)}")
-            for assignment in standby_assignments:
-                date_obj = datetime.datetime.strptime(assignment["date"], '%Y-%m-%d').date()
-                weekday_name = date_obj.strftime('%A')
-                doctor_id = assignment['doctor']
-                
-                # Log workload context for assigned doctor
-                workload_context = ""
-                if doctor_id in workload_data:
-                    wd = workload_data[doctor_id]
-                    workload_context = f" (12m_standby: {wd['standby_count_12m']}, days_since: {wd['days_since_last_standby']})"
+            if log_details:
+                logger.info(f"Assignment breakdown: {dict(posts_filled)}")
+                logger.info(f"Clinic assignments: {len(clinic_assignments)} (distinct unit/date pairs)")
+                logger.info(f"Standby Oncall assignments: {len(standby_assignments)}")
+                weekday_names = {date_str: date.strftime('%A') for date_str, date in zip(date_strs, date_list)}
+                for assignment in standby_assignments:
+                    weekday_name = weekday_names[assignment["date"]]
+                    doctor_id = assignment['doctor']
+                    
+                    # Log workload context for assigned doctor
+                    d_i = doc_idx[doctor_id]
+                    workload_context = f" (12m_standby: {standby_12m[d_i]:g}, days_since: {days_since[d_i]:g})"
+                    
+                    logger.info(f"  {assignment['doctor']} -> {assignment['date']} ({weekday_name}){workload_context}")
                 
-                logger.info(f"  {assignment['doctor']} -> {assignment['date']} ({weekday_name}){workload_context}")
-            
-            # Log doctors who were eligible but not assigned
-            if workload_data:
-                eligible_doctors = [d for d in D if workload_data.get(d, {}).get('standby_count_12m', 0) == 0]
-                assigned_doctors = [a['doctor'] for a in standby_assignments]
+                # Log doctors who were eligible but not assigned
+                eligible_doctors = [d for d, count in zip(D, standby_12m) if count == 0]
+                assigned_doctors = {a['doctor'] for a in standby_assignments}
                 not_assigned = [d for d in eligible_doctors if d not in assigned_doctors]
                 if not_assigned:
                     logger.info(f"Eligible doctors not assigned Standby: {not_assigned[:5]}")  # Show first 5
                 
         else:
-            logger.warning(f"Solver failed with status: {final_problem.status}")
+            logger.warning(f"Solver failed with status: {final.status}")
         
         # === CALCULATE STATISTICS ===
         stats = {
             "total_assignments": len(results),
-            "doctors_used": len(set(item["doctor"] for item in results)),
-            "posts_filled": {},
-            "assignments_by_date": {},
-            "workload_by_doctor": {},
-            "solver_status": str(final_problem.status),
-            "objective_value": final_problem.value if final_problem.value is not None else None
+            "doctors_used": len(workload_by_doctor),
+            "posts_filled": dict(posts_filled),
+            "assignments_by_date": dict(assignments_by_date),
+            "workload_by_doctor": dict(workload_by_doctor),
+            "solver_status": str(final.status),
+            "objective_value": final.value if final.value is not None else None
         }
         
-        # Calculate detailed statistics
-        for item in results:
-            # Posts filled
-            post = item["post"]
-            if post not in stats["posts_filled"]:
-                stats["posts_filled"][post] = 0
-            stats["posts_filled"][post] += 1
-            
-            # Assignments by date
-            date = item["date"]
-            if date not in stats["assignments_by_date"]:
-                stats["assignments_by_date"][date] = 0
-            stats["assignments_by_date"][date] += 1
-            
-            # Workload by doctor
-            doctor = item["doctor"]
-            if doctor not in stats["workload_by_doctor"]:
-                stats["workload_by_doctor"][doctor] = 0
-            stats["workload_by_doctor"][doctor] += 1
-        
         # Prepare final warnings
         final_warnings = pairing_warnings.copy()
         
         return {
             "schedule": results,
             "statistics": stats,
-            "solver_status": str(final_problem.status),
-            "objective_value": final_problem.value if final_problem.value is not None else None,
-            "success": final_problem.status in [cp.OPTIMAL, cp.OPTIMAL_INACCURATE],
+            "solver_status": str(final.status),
+            "objective_value": final.value if final.value is not None else None,
+            "success": final.status in [cp.OPTIMAL, cp.OPTIMAL_INACCURATE],
             "warnings": final_warnings,
-            "weekend_assignments": len([d for d in D for w in range(len(weekend_pairs)) 
-                                       if (d, w) in final_y and final_y[d, w].value is not None and final_y[d, w].value > 0.5]) if final_problem.status in [cp.OPTIMAL, cp.OPTIMAL_INACCURATE] else 0
+            "weekend_assignments": len(weekend_assignments)
         }
         
     except Exception as e:
@@ -777,10 +900,10 @@ def run_prime_scheduler(config: Dict[str, Any]) -> Dict[str, Any]:
 if __name__ == "__main__":
     # For testing - read from stdin or file
     if len(sys.argv) > 1:
-        with open(sys.argv[1], 'r') as f:
-            config = json.load(f)
+        with open(sys.argv[1], 'rb') as f:
+            config = orjson.loads(f.read())
     else:
-        config = json.load(sys.stdin)
+        config = orjson.loads(sys.stdin.buffer.read())
     
     result = run_prime_scheduler(config)
-    print(json.dumps(result, indent=2, default=str))
\ No newline at end of file
+    sys.stdout.buffer.write(orjson.dumps(result, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE))
\ No newline at end of file
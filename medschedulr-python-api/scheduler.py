@@ -3,6 +3,7 @@ import numpy as np
 import pandas as pd
 import datetime
 import math
+from collections import Counter
 from typing import Dict, List, Optional, Any, Tuple
 from pydantic import BaseModel
 import logging
@@ -39,6 +40,7 @@ class MedicalScheduler:
         while current <= config.roster_end:
             self.date_list.append(current)
             current += datetime.timedelta(days=1)
+        self.date_strs = [d.isoformat() for d in self.date_list]
         
         # Initialize solver parameters with defaults
         self.lambda_rest = self.solver_config.get('lambdaRest', 3)
@@ -54,6 +56,7 @@ class MedicalScheduler:
         self.lambda_after_clinic = self.solver_config.get('clinicPenaltyAfter', 5)
         self.big_M = self.solver_config.get('bigM', 10000)
         self.solver_timeout = self.solver_config.get('solverTimeoutSeconds', 600)
+        self.mip_gap = float(self.solver_config.get('mipGap', 0.01))
     
     def generate_schedule(
         self, 
@@ -96,7 +99,7 @@ class MedicalScheduler:
             
             if phase1_result["status"] == "optimal":
                 logger.info("Phase 1 succeeded - using optimal solution")
-                schedule = self._extract_schedule(phase1_result["solution"], doctors, posts_by_day)
+                schedule = self._extract_schedule(phase1_result["solution"], doctors, phase1_result.get("posts"))
                 stats = self._calculate_statistics(schedule, doctors_data, units_data)
                 return SchedulingResult(
                     schedule=schedule,
@@ -113,7 +116,7 @@ class MedicalScheduler:
                     posts_by_day, oncall_posts, unit_to_docs, availability_data
                 )
                 
-                schedule = self._extract_schedule(phase2_result["solution"], doctors, posts_by_day)
+                schedule = self._extract_schedule(phase2_result["solution"], doctors, phase2_result.get("posts"))
                 stats = self._calculate_statistics(schedule, doctors_data, units_data)
                 return SchedulingResult(
                     schedule=schedule,
@@ -126,6 +129,30 @@ class MedicalScheduler:
             logger.error(f"Error in schedule generation: {e}")
             raise e
     
+    def _decision_variables(self, doctors, posts_by_day, availability_data):
+        """One boolean (doctor, day, post) tensor variable plus the availability mask bounding it"""
+        S = len(self.date_list)
+        posts = list(dict.fromkeys(t for s in range(S) for t in posts_by_day[s]))
+        post_idx = {t: i for i, t in enumerate(posts)}
+        doc_idx = {d: i for i, d in enumerate(doctors)}
+        day_idx = {date: s for s, date in enumerate(self.date_strs)}
+        
+        # worked[s, t] = True iff post t is rostered on day s
+        worked = np.zeros((S, len(posts)), dtype=bool)
+        for s in range(S):
+            worked[s, [post_idx[t] for t in posts_by_day[s]]] = True
+        
+        # avail[d, s, t] = True iff doctor d is available for post t on day s
+        avail = np.zeros((len(doctors), S, len(posts)), dtype=bool)
+        for (d, date, t), available in availability_data.items():
+            if available and d in doc_idx and date in day_idx and t in post_idx:
+                avail[doc_idx[d], day_idx[date], post_idx[t]] = True
+        avail &= worked
+        
+        # x[d,s,t] = 1 if doctor d works post t on day s; unavailable cells are pinned to 0
+        X = cp.Variable(avail.shape, boolean=True)
+        return X, avail, posts, post_idx
+    
     def _run_phase1(self, doctors, units, doctors_data, units_data, posts_by_day, oncall_posts, unit_to_docs, availability_data):
         """Phase 1: Strict constraints"""
         try:
@@ -133,54 +160,43 @@ class MedicalScheduler:
             
             # Decision variables
             S = list(range(len(self.date_list)))
-            x = {}  # x[d,s,t] = 1 if doctor d works post t on day s
-            
-            # Create decision variables only for valid combinations
-            for d in doctors:
-                for s in S:
-                    for t in posts_by_day[s]:
-                        key = (d, self.date_list[s].strftime('%Y-%m-%d'), t)
-                        if key in availability_data and availability_data[key]:
-                            x[d, s, t] = cp.Variable(boolean=True)
+            X, avail, posts, post_idx = self._decision_variables(doctors, posts_by_day, availability_data)
             
-            # Constraints
-            constraints = []
-            
-            # Each post must be filled each day
-            for s in S:
-                for t in posts_by_day[s]:
-                    assigned_vars = [x[d, s, t] for d in doctors if (d, s, t) in x]
-                    if assigned_vars:
-                        constraints.append(cp.sum(assigned_vars) == 1)
+            def strict_constraints(V):
+                # Constraints
+                constraints = [V <= avail]
+                
+                # Each post must be filled each day (where anyone is available for it)
+                needed = avail.any(axis=0)
+                constraints.append(cp.sum(V, axis=0)[needed] == 1)
+                
+                # Each doctor can work at most one post per day
+                constraints.append(cp.sum(V, axis=2) <= 1)
+                
+                # Rest constraints: 48-hour break after on-call
+                oncall_idx = np.flatnonzero(np.isin(posts, list(oncall_posts)))
+                if oncall_idx.size and len(S) > 1:
+                    # oncall_daily[d, s] = number of on-call posts doctor d works on day s
+                    oncall_daily = cp.sum(V[:, :, oncall_idx], axis=2)
+                    constraints.append(oncall_daily[:, :-1] + oncall_daily[:, 1:] <= 1)
+                return constraints
             
-            # Each doctor can work at most one post per day
-            for d in doctors:
-                for s in S:
-                    day_vars = [x[d, s, t] for t in posts_by_day[s] if (d, s, t) in x]
-                    if day_vars:
-                        constraints.append(cp.sum(day_vars) <= 1)
+            # Feasibility probe: if the LP relaxation is infeasible the MIP is too,
+            # so go straight to Phase 2 instead of letting CBC prove it
+            probe = cp.Problem(cp.Minimize(0), strict_constraints(cp.Variable(avail.shape, nonneg=True)))
+            probe.solve(solver=cp.CBC, verbose=False)
+            if probe.status in (cp.INFEASIBLE, cp.INFEASIBLE_INACCURATE):
+                logger.info("Phase 1 LP relaxation is infeasible - skipping MIP solve")
+                return {"status": probe.status, "solution": None, "objective_value": None}
             
-            # Rest constraints: 48-hour break after on-call
-            for d in doctors:
-                for s in S[:-1]:  # Don't check last day
-                    oncall_today = [x[d, s, t] for t in posts_by_day[s] if t in oncall_posts and (d, s, t) in x]
-                    if oncall_today and s + 1 < len(S):
-                        oncall_tomorrow = [x[d, s+1, t] for t in posts_by_day[s+1] if t in oncall_posts and (d, s+1, t) in x]
-                        if oncall_tomorrow:
-                            constraints.append(cp.sum(oncall_today) + cp.sum(oncall_tomorrow) <= 1)
+            constraints = strict_constraints(X)
             
             # Build objective
-            objective_terms = []
-            
             # Add penalty terms based on lambda weights
             # (Simplified version - full implementation would include all penalty terms from primeVersion2.py)
             
             # Minimize total assignments (basic load balancing)
-            for d in doctors:
-                total_assignments = cp.sum([x[d, s, t] for s in S for t in posts_by_day[s] if (d, s, t) in x])
-                objective_terms.append(total_assignments)
-            
-            objective = cp.Minimize(cp.sum(objective_terms))
+            objective = cp.Minimize(cp.sum(X))
             
             # Solve
             problem = cp.Problem(objective, constraints)
@@ -190,7 +206,8 @@ class MedicalScheduler:
                 logger.info(f"Phase 1 optimal solution found with objective value: {problem.value}")
                 return {
                     "status": "optimal",
-                    "solution": x,
+                    "solution": X,
+                    "posts": posts,
                     "objective_value": problem.value,
                     "problem": problem
                 }
@@ -207,44 +224,25 @@ class MedicalScheduler:
         try:
             logger.info("Running Phase 2 with relaxed constraints")
             
-            S = list(range(len(self.date_list)))
-            x = {}
-            
             # Create decision variables
-            for d in doctors:
-                for s in S:
-                    for t in posts_by_day[s]:
-                        key = (d, self.date_list[s].strftime('%Y-%m-%d'), t)
-                        if key in availability_data and availability_data[key]:
-                            x[d, s, t] = cp.Variable(boolean=True)
+            X, avail, posts, post_idx = self._decision_variables(doctors, posts_by_day, availability_data)
             
             # Soft constraints with penalty variables
-            constraints = []
-            penalty_vars = []
+            constraints = [X <= avail]
             
             # Each post should be filled (soft constraint)
-            for s in S:
-                for t in posts_by_day[s]:
-                    assigned_vars = [x[d, s, t] for d in doctors if (d, s, t) in x]
-                    if assigned_vars:
-                        penalty = cp.Variable(nonneg=True)
-                        penalty_vars.append(self.big_M * penalty)
-                        constraints.append(cp.sum(assigned_vars) + penalty >= 1)
+            needed = avail.any(axis=0)
+            penalty = cp.Variable(int(needed.sum()), nonneg=True)
+            constraints.append(cp.sum(X, axis=0)[needed] + penalty >= 1)
             
             # Each doctor works at most one post per day (hard constraint)
-            for d in doctors:
-                for s in S:
-                    day_vars = [x[d, s, t] for t in posts_by_day[s] if (d, s, t) in x]
-                    if day_vars:
-                        constraints.append(cp.sum(day_vars) <= 1)
+            constraints.append(cp.sum(X, axis=2) <= 1)
             
             # Build objective with penalty terms
-            objective_terms = penalty_vars.copy()
+            objective_terms = [self.big_M * cp.sum(penalty)]
             
             # Add workload balancing terms
-            for d in doctors:
-                total_assignments = cp.sum([x[d, s, t] for s in S for t in posts_by_day[s] if (d, s, t) in x])
-                objective_terms.append(total_assignments)
+            objective_terms.append(cp.sum(X))
             
             objective = cp.Minimize(cp.sum(objective_terms))
             
@@ -255,7 +253,8 @@ class MedicalScheduler:
             logger.info(f"Phase 2 completed with status: {problem.status}")
             return {
                 "status": problem.status,
-                "solution": x,
+                "solution": X,
+                "posts": posts,
                 "objective_value": problem.value,
                 "problem": problem
             }
@@ -264,26 +263,19 @@ class MedicalScheduler:
             logger.error(f"Error in Phase 2: {e}")
             return {"status": "error", "solution": None, "error": str(e), "objective_value": None}
     
-    def _extract_schedule(self, solution_vars, doctors, posts_by_day):
+    def _extract_schedule(self, solution, doctors, posts):
         """Extract schedule from CVXPY solution"""
         schedule = []
         
-        if solution_vars is None:
+        if solution is None or solution.value is None:
             return schedule
         
-        S = list(range(len(self.date_list)))
-        
-        for d in doctors:
-            for s in S:
-                for t in posts_by_day[s]:
-                    if (d, s, t) in solution_vars:
-                        var = solution_vars[d, s, t]
-                        if var.value is not None and var.value > 0.5:  # Binary variable threshold
-                            schedule.append({
-                                "doctor": d,
-                                "date": self.date_list[s].isoformat(),
-                                "post": t
-                            })
+        for d_i, s, t_i in np.argwhere(solution.value > 0.5):  # Binary variable threshold
+            schedule.append({
+                "doctor": doctors[d_i],
+                "date": self.date_strs[s],
+                "post": posts[t_i]
+            })
         
         return schedule
     
@@ -297,7 +289,8 @@ class MedicalScheduler:
         
         logger.info("Using CBC solver for mixed-integer programming")
         try:
-            problem.solve(solver=cp.CBC, verbose=False)
+            problem.solve(solver=cp.CBC, verbose=False,
+                          maximumSeconds=self.solver_timeout, allowableFractionGap=self.mip_gap)
             logger.info(f"CBC solver finished with status: {problem.status}")
         except Exception as e:
             logger.error(f"CBC solver failed: {e}")
@@ -305,33 +298,11 @@ class MedicalScheduler:
 
     def _calculate_statistics(self, schedule, doctors_data, units_data):
         """Calculate schedule statistics"""
-        stats = {
+        workload_by_doctor = Counter(item["doctor"] for item in schedule)
+        return {
             "total_assignments": len(schedule),
-            "doctors_used": len(set(item["doctor"] for item in schedule)),
-            "coverage_by_day": {},
-            "workload_by_doctor": {},
-            "posts_filled": {}
+            "doctors_used": len(workload_by_doctor),
+            "coverage_by_day": dict(Counter(item["date"] for item in schedule)),
+            "workload_by_doctor": dict(workload_by_doctor),
+            "posts_filled": dict(Counter(item["post"] for item in schedule))
         }
-        
-        # Calculate coverage by day
-        for item in schedule:
-            date = item["date"]
-            if date not in stats["coverage_by_day"]:
-                stats["coverage_by_day"][date] = 0
-            stats["coverage_by_day"][date] += 1
-        
-        # Calculate workload by doctor
-        for item in schedule:
-            doctor = item["doctor"]
-            if doctor not in stats["workload_by_doctor"]:
-                stats["workload_by_doctor"][doctor] = 0
-            stats["workload_by_doctor"][doctor] += 1
-        
-        # Calculate posts filled
-        for item in schedule:
-            post = item["post"]
-            if post not in stats["posts_filled"]:
-                stats["posts_filled"][post] = 0
-            stats["posts_filled"][post] += 1
-        
-        return stats
\ No newline at end of file
@@ -1,17 +1,10 @@
 import cvxpy as cp
 import numpy as np
 import pandas as pd
-import random
 import datetime
 import math  # for ceiling on 25% cap
-
-# --------------------------------------------------------------------------------
-# Utility to compute full months difference between two dates
-def months_since(start_date, end_date):
-    """
-    Return the number of whole months between start_date and end_date.
-    """
-    return (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
+import multiprocessing
+import os
 
 # --------------------------------------------------------------------------------
 # Specify the roster period via start and end dates
@@ -50,6 +43,7 @@ doctors_per_unit = 6
 
 units = [f"Unit{i+1}" for i in range(num_units)]
 categories = ["floater", "junior", "senior", "registrar"]
+FLOATER, JUNIOR, SENIOR, REGISTRAR = range(len(categories))  # codes into categories
 
 # Weekday and weekend posts as per spec
 posts_weekday = [
@@ -67,34 +61,19 @@ posts_weekend = [
 oncall_posts = set(posts_weekday + posts_weekend)
 
 # --------------------------------------------------------------------------------
-# Generate doctors and their metadata
-doctors = []
-doctor_info = {}
-for u in units:
-    for i in range(doctors_per_unit):
-        name = f"{u}_Doc{i+1}"
-        cat = random.choices(categories, weights=[0.1, 0.4, 0.4, 0.1])[0]
-        doctors.append(name)
-        if cat != "floater":
-            months_back = random.randint(0, 3)
-            m = roster_start.month - months_back
-            y = roster_start.year
-            while m <= 0:
-                m += 12
-                y -= 1
-            last_standby_date = datetime.date(y, m, 1)
-        else:
-            last_standby_date = None
-        doctor_info[name] = {
-            "unit": u,
-            "category": cat,
-            "last_standby": last_standby_date,
-            "workload": {
-                "weekday": random.randint(0, 6),
-                "weekend": random.randint(0, 4),
-                "ED":      random.randint(0, 5),
-            }
-        }
+# Generate doctors and their metadata (all random draws are vectorized).
+# Metadata is kept as arrays aligned with `doctors` so the model build can mask on it.
+rng = np.random.default_rng()
+
+doctors = [f"{u}_Doc{i+1}" for u in units for i in range(doctors_per_unit)]
+doctor_unit = np.arange(len(doctors)) // doctors_per_unit  # index into units
+doctor_cat = rng.choice(len(categories), size=len(doctors), p=[0.1, 0.4, 0.4, 0.1])
+# Months between the doctor's last Standby (first of that month) and the roster start;
+# floaters have never done Standby
+months_back = rng.integers(0, 3, size=len(doctors), endpoint=True)
+months_ago = np.where(doctor_cat == FLOATER, 99, months_back)
+# weekday 0-6, weekend 0-4, ED 0-5 past on-calls
+past_workload = rng.integers(0, [6, 4, 5], size=(len(doctors), 3), endpoint=True)
 
 # Build posts_by_day mapping based on weekday/weekend of each date
 posts_by_day = {}
@@ -106,25 +85,35 @@ for idx, date in enumerate(date_list):
 D = doctors
 S = list(range(len(date_list)))
 
-# Precompute unit->doctor list (used in per-unit/day soft cap)
-unit_to_docs = {u: [d for d in D if doctor_info[d]['unit'] == u] for u in units}
+# Fixed post index over the weekday and weekend lists; valid[s, t] marks posts that exist on day s
+all_posts = list(dict.fromkeys(posts_weekday + posts_weekend))
+post_idx = {t: i for i, t in enumerate(all_posts)}
+valid = np.zeros((len(S), len(all_posts)), dtype=bool)
+for s in S:
+    valid[s, [post_idx[t] for t in posts_by_day[s]]] = True
+
+# Post predicates along the post axis, weekend flag along the day axis
+is_oncall   = np.array([t in oncall_posts for t in all_posts])
+is_ward     = np.array([t.startswith("Ward") for t in all_posts])
+is_ED       = np.array([t.startswith("ED") for t in all_posts])
+is_standby  = np.array([t == "Standby Oncall" for t in all_posts])
+is_reg_only = np.array(["Registrar" in t for t in all_posts])
+is_weekend  = np.array([date.weekday() >= 5 for date in date_list])
+
+# Precompute unit membership matrix M[u, d] (used in per-unit/day soft cap)
+unit_membership = (doctor_unit == np.arange(len(units))[:, None]).astype(float)
+
+# capped_unit_day[u, s] = True unless day s is one of unit u's clinic weekdays
+capped_unit_day = np.array([[date.weekday() not in clinic_days.get(u, []) for date in date_list]
+                            for u in units])
 
 # === Simulated availability === (65% chance available)
-# (Compute once so Phase 1 and Phase 2 see the same availability)
-def build_base_availability():
-    # We'll create a dict for all (d,s,t) keys that exist in the model
-    avail = {}
-    for d in D:
-        for s in S:
-            for t in posts_by_day[s]:
-                avail[(d, s, t)] = int(random.random() < 0.65)
-    # Floater MOs should never be on-call: force their availability to 0
-    for (d, s, t) in list(avail):
-        if doctor_info[d]["category"] == "floater" and t in oncall_posts:
-            avail[(d, s, t)] = 0
-    return avail
-
-availability = build_base_availability()
+# (Drawn once so Phase 1 and Phase 2 see the same availability)
+# avail_arr[d, s, t] as int8 in one draw; posts that don't exist on a day stay 0
+avail_arr = ((rng.random((len(D), len(S), len(all_posts))) < 0.65) & valid).astype(np.int8)
+# Floater MOs should never be on-call: force their availability to 0
+floater = doctor_cat == FLOATER
+avail_arr[floater] &= ~is_oncall
 
 # --------------------------------------------------------------------------------
 # Initialize weights used in objective / penalties (shared by both phases)
@@ -149,291 +138,275 @@ lambda_junior_ward = 6  # medium penalty for juniors assigned to ward posts
 # === RELAXATION (Phase 2) Big-M weight ===
 BIG_M = 10000.0  # very large penalty applied to slack variables when relaxing "hard" rules
 
+# === MILP solver: HiGHS (10-minute limit, 2% relative gap), CBC if highspy is missing ===
+if cp.HIGHS in cp.installed_solvers():
+    SOLVER_OPTS = {"solver": cp.HIGHS, "time_limit": 600, "mip_rel_gap": 0.02}
+else:
+    SOLVER_OPTS = {"solver": cp.CBC, "maximumSeconds": 600}
+# The x tensor is 3-D, which only the SciPy canonicalization backend handles (CPP rejects it),
+# so name it instead of relying on CVXPY's automatic fallback
+SOLVER_OPTS["canon_backend"] = cp.SCIPY_CANON_BACKEND
+
+# Solve Phase 2 alongside Phase 1 instead of waiting for Phase 1 to fail
+# (only pays off when a second core is free for the speculative solve)
+PARALLEL_PHASES = (os.cpu_count() or 1) > 1 and "fork" in multiprocessing.get_all_start_methods()
+
+# --------------------------------------------------------------------------------
+# Linear per-cell penalty weights W[d, s, t] (shared by both phases).
+# Overlapping rules add up; the objective then takes one cp.sum(cp.multiply(W, x)).
+W = np.zeros((len(D), len(S), len(all_posts)))
+
+# Clinic penalties (soft costs, not constraints): clinic_weight[u, s] sums the weights for
+# being on-call the day before, the day of and the day after any of unit u's clinic days
+clinic_day = (~capped_unit_day).astype(float)
+clinic_weight = lambda_same_clinic * clinic_day
+clinic_weight[:, :-1] += lambda_before_clinic * clinic_day[:, 1:]
+clinic_weight[:, 1:] += lambda_after_clinic * clinic_day[:, :-1]
+W += (unit_membership.T @ clinic_weight)[:, :, None] * (valid & is_oncall)
+
+# Soft penalty for registrars doing any on-call on a weekend
+W[doctor_cat == REGISTRAR] += lambda_reg_weekend * (valid & is_weekend[:, None] & is_oncall)
+# NEW: Medium penalty for juniors on ward posts (weekday or weekend).
+# Ward posts are named "Ward..." in both weekday and weekend lists.
+W[doctor_cat == JUNIOR] += lambda_junior_ward * (valid & is_ward)
+# 5) Standby priority: reward those who waited longer (soft bonus)
+W -= lambda_standby * months_ago[:, None, None] * (valid & is_standby)
+# 8) ED penalty for seniors & registrars
+W[np.isin(doctor_cat, [SENIOR, REGISTRAR])] += lambda_ED * (valid & is_ED)
+
 # --------------------------------------------------------------------------------
-# Helper that builds & solves the model.
-# If RELAX=False → your current hard/soft split.
-# If RELAX=True  → convert every "hard" rule into a soft rule with nonneg slack and Big-M penalty.
-def build_and_solve(RELAX: bool):
+# Builds the model once for both phases.
+# Every "hard" rule has a nonneg slack with a Big-M penalty, bounded by relax * (its largest useful value):
+# relax = 0 → slacks are forced to 0, i.e. your current hard/soft split (Phase 1).
+# relax = 1 → every "hard" rule becomes a soft rule with Big-M penalty (Phase 2).
+# relax is a cp.Parameter, so the second solve reuses the canonicalized problem.
+def build_model():
+    relax = cp.Parameter(nonneg=True)
+
     # === Decision variables ===
-    x = {(d, s, t): cp.Variable(boolean=True)
-         for d in D for s in S for t in posts_by_day[s]}
+    # x[d, s, t] = 1 if doctor d works post t on day s (cells outside valid are pinned to 0)
+    x = cp.Variable((len(D), len(S), len(all_posts)), boolean=True)
 
     # === Soft variables (shared) ===
-    rest_violation = {(d, s): cp.Variable(boolean=True)
-                      for d in D for s in S if s <= len(date_list) - 3}
-    z_gap          = {(d, s): cp.Variable(boolean=True)
-                      for d in D for s in S if s <= len(date_list) - 3}
-    min_one_slack  = {d: cp.Variable(boolean=True)
-                      for d in D if doctor_info[d]["category"] != "floater"}
-
-    # Initialize penalty terms (will collect everything here)
+    # Continuous in [0, 1] is enough: with x binary each one settles on 0/1 at the optimum
+    # (rest_violation is minimized against an integer bound, z_gap is capped by 1 - x).
+    # The <= 1 bound on rest_violation is what keeps 3 on-calls in 3 days out, as the boolean did.
+    # Both are indexed [d, s] for the 3-day window starting on day s.
+    rest_violation = cp.Variable((len(D), len(S) - 2), nonneg=True)
+    z_gap          = cp.Variable((len(D), len(S) - 2), nonneg=True)
+
+    # Slack-based penalty terms (the per-cell linear penalties live in W)
     penalty_terms = []
 
-    # Clinic penalties (same for both phases, these are soft costs not constraints)
-    for d in D:
-        unit = doctor_info[d]["unit"]
-        days_for_unit = clinic_days.get(unit, [])
-        for s, date in enumerate(date_list):
-            if date.weekday() in days_for_unit:
-                for delta in (-1, 0, 1):
-                    idx = s + delta
-                    if 0 <= idx < len(date_list):
-                        for t in posts_by_day[idx]:
-                            if t in oncall_posts:
-                                if delta == -1:
-                                    penalty_terms.append(lambda_before_clinic * x[d, idx, t])
-                                elif delta == 0:
-                                    penalty_terms.append(lambda_same_clinic   * x[d, idx, t])
-                                else:  # +1
-                                    penalty_terms.append(lambda_after_clinic  * x[d, idx, t])
-
-    # Soft penalty for registrars doing any on-call on a weekend
-    for (d, s, t), var in x.items():
-        if (doctor_info[d]["category"] == "registrar"
-            and date_list[s].weekday() >= 5
-            and t in oncall_posts):
-            penalty_terms.append(lambda_reg_weekend * var)
-
-    # NEW: Medium penalty for juniors on ward posts (weekday or weekend).
-    # Ward posts are named "Ward..." in both weekday and weekend lists.
-    for (d, s, t), var in x.items():
-        if doctor_info[d]["category"] == "junior" and t.startswith("Ward"):
-            penalty_terms.append(lambda_junior_ward * var)
-
     # === Constraints ===
     constraints = []
 
     # --- Soft cap: at most ~25% of a unit assigned to on-call per day (skip that unit's clinic days) ---
     cap_per_unit = math.ceil(0.25 * doctors_per_unit)  # e.g., 7 -> 2
-    for u in units:
-        u_docs = unit_to_docs[u]
-        clinic_weekdays = set(clinic_days.get(u, []))
-        for s, date in enumerate(date_list):
-            # Skip cap on this unit's clinic weekdays
-            if date.weekday() in clinic_weekdays:
-                continue
-            # Count all on-call assignments for unit u on day s
-            assigned_u_s = cp.sum([
-                x[d, s, t]
-                for d in u_docs
-                for t in posts_by_day[s]
-                if t in oncall_posts
-            ])
-            # Soft overage slack and penalty
-            over_us = cp.Variable(nonneg=True)
-            constraints.append(assigned_u_s <= cap_per_unit + over_us)
-            penalty_terms.append(lambda_unit_over * over_us)
+    # daily_oncall[d, s] = number of on-call posts doctor d works on day s
+    oncall_idx = np.flatnonzero(is_oncall)
+    daily_oncall = cp.sum(x[:, :, oncall_idx], axis=2)
+    # Count all on-call assignments per unit and day, capped only off the unit's clinic weekdays
+    unit_day_load = unit_membership @ daily_oncall
+    if capped_unit_day.any():
+        # Soft overage slack and penalty
+        over = cp.Variable(int(capped_unit_day.sum()), nonneg=True)
+        # A unit-day load is at most one on-call per doctor in Phase 1; Phase 2's double-booking
+        # slack lets each doctor stack up to every post, so the bound widens with relax
+        unit_day_max = doctors_per_unit * (1 + relax * (len(all_posts) - 1))
+        constraints += [unit_day_load[capped_unit_day] <= cap_per_unit + over,
+                        over <= unit_day_max - cap_per_unit]
+        penalty_terms.append(lambda_unit_over * cp.sum(over))
+
+    # 0) posts that don't exist on a day are never filled (hard in both phases)
+    coverage = cp.sum(x, axis=0)
+    if (~valid).any():
+        constraints.append(coverage[~valid] == 0)
 
     # 1) each post filled exactly once per day
-    for s in S:
-        for t in posts_by_day[s]:
-            if not RELAX:
-                constraints.append(cp.sum([x[d, s, t] for d in D]) == 1)
-            else:
-                cov = cp.sum([x[d, s, t] for d in D])
-                s_pos = cp.Variable(nonneg=True)  # overfill
-                s_neg = cp.Variable(nonneg=True)  # underfill
-                constraints += [cov <= 1 + s_pos, cov >= 1 - s_neg]
-                penalty_terms.append(BIG_M * (s_pos + s_neg))
-
-    # 2) respect availability
-    for (d, s, t), var in x.items():
-        if not RELAX:
-            constraints.append(var <= availability[d, s, t])
-        else:
-            # allow violation: var <= avail + slack
-            s_av = cp.Variable(nonneg=True)
-            constraints.append(var <= availability[d, s, t] + s_av)
-            penalty_terms.append(BIG_M * s_av)
+    s_pos = cp.Variable(int(valid.sum()), nonneg=True)  # overfill
+    s_neg = cp.Variable(int(valid.sum()), nonneg=True)  # underfill
+    constraints += [coverage[valid] <= 1 + s_pos, coverage[valid] >= 1 - s_neg,
+                    s_pos <= relax * len(D), s_neg <= relax]
+    penalty_terms.append(BIG_M * cp.sum(s_pos + s_neg))
+
+    # 2) respect availability: x <= avail + slack
+    s_av = cp.Variable(x.shape, nonneg=True)
+    constraints += [x <= avail_arr + s_av, s_av <= relax]
+    penalty_terms.append(BIG_M * cp.sum(s_av))
 
     # 3) no double booking
-    for d in D:
-        for s in S:
-            if not RELAX:
-                constraints.append(cp.sum([x[d, s, t] for t in posts_by_day[s]]) <= 1)
-            else:
-                s_db = cp.Variable(nonneg=True)
-                constraints.append(cp.sum([x[d, s, t] for t in posts_by_day[s]]) <= 1 + s_db)
-                penalty_terms.append(BIG_M * s_db)
-
-    # 4) registrar-only
-    for (d, s, t), var in x.items():
-        if "Registrar" in t and doctor_info[d]["category"] != "registrar":
-            if not RELAX:
-                constraints.append(var == 0)
-            else:
-                # relax to var <= slack
-                s_reg = cp.Variable(nonneg=True)
-                constraints.append(var <= s_reg)
-                penalty_terms.append(BIG_M * s_reg)
-
-    # 5) Soft: standby priority + restriction
-    for (d, s, t), var in x.items():
-        if t == "Standby Oncall":
-            last_date = doctor_info[d]["last_standby"]
-            months_ago = months_since(last_date, roster_start) if last_date else 99
-            # Disallow if did last month (still hard/relaxed below)
-            if months_ago < 1:
-                if not RELAX:
-                    constraints.append(var == 0)
-                else:
-                    s_last = cp.Variable(nonneg=True)
-                    constraints.append(var <= s_last)  # only through slack
-                    penalty_terms.append(BIG_M * s_last)
-            # Reward those who waited longer (soft bonus)
-            penalty_terms.append(-lambda_standby * months_ago * var)
+    s_db = cp.Variable((len(D), len(S)), nonneg=True)
+    constraints += [cp.sum(x, axis=2) <= 1 + s_db, s_db <= relax * len(all_posts)]
+    penalty_terms.append(BIG_M * cp.sum(s_db))
+
+    # 4) registrar-only posts, 5) no Standby for doctors who did it last month: x <= slack
+    # (the Standby waiting-time bonus is in W)
+    blocked = valid & ((is_reg_only & (doctor_cat != REGISTRAR)[:, None, None])
+                       | (is_standby & (months_ago < 1)[:, None, None]))
+    if blocked.any():
+        s_blocked = cp.Variable(int(blocked.sum()), nonneg=True)
+        constraints += [x[blocked] <= s_blocked, s_blocked <= relax]
+        penalty_terms.append(BIG_M * cp.sum(s_blocked))
 
     # 5b) at most one Standby Oncall per doctor per month
-    for d in D:
-        if not RELAX:
-            constraints.append(
-                cp.sum([x[d, s, "Standby Oncall"]
-                        for s in S
-                        if "Standby Oncall" in posts_by_day[s]]) <= 1
-            )
-        else:
-            s_once = cp.Variable(nonneg=True)
-            constraints.append(
-                cp.sum([x[d, s, "Standby Oncall"]
-                        for s in S
-                        if "Standby Oncall" in posts_by_day[s]]) <= 1 + s_once
-            )
-            penalty_terms.append(BIG_M * s_once)
-
-    # 6) Soft: rest violation (2-day)
-    for d in D:
-        for s in range(len(date_list) - 2):
-            onc = [x[d, s+i, t]
-                   for i in range(3)
-                   for t in posts_by_day[s+i]
-                   if t in oncall_posts]
-            constraints.append(rest_violation[d, s] >= cp.sum(onc) - 1)
-
-    # 7) Soft: reward 3-day rest gaps
-    for d in D:
-        for s in range(len(date_list) - 2):
-            for i in range(3):
-                for t in posts_by_day[s+i]:
-                    if t in oncall_posts:
-                        constraints.append(z_gap[d, s] <= 1 - x[d, s+i, t])
-
-    # 8) Soft: ED penalty for seniors & registrars
-    for (d, s, t), var in x.items():
-        if t.startswith("ED") and doctor_info[d]["category"] in ["senior", "registrar"]:
-            penalty_terms.append(lambda_ED * var)
+    if is_standby.any():
+        s_once = cp.Variable(len(D), nonneg=True)
+        constraints += [cp.sum(x[:, :, np.flatnonzero(is_standby)], axis=(1, 2)) <= 1 + s_once,
+                        s_once <= relax * len(S)]
+        penalty_terms.append(BIG_M * cp.sum(s_once))
+
+    # 6) Soft: rest violation (2-day), on-call count over each 3-day window
+    window = daily_oncall[:, :-2] + daily_oncall[:, 1:-1] + daily_oncall[:, 2:]
+    constraints += [rest_violation >= window - 1, rest_violation <= 1]
+
+    # 7) Soft: reward 3-day rest gaps; z_gap[d, s] <= 1 - x for every on-call cell in the window
+    # (per cell rather than against daily_oncall, so a double-booked day in Phase 2 stays feasible)
+    n_windows = len(S) - 2
+    constraints += [z_gap[:, :, None] <= 1 - x[:, i:i + n_windows, oncall_idx] for i in range(3)]
+    constraints.append(z_gap <= 1)
+
+    # Total on-call assignments per doctor over the roster, for non-floaters only
+    nonfloater = doctor_cat != FLOATER
+    assigned = cp.sum(daily_oncall, axis=1)[nonfloater]
 
     # 9) Soft: every non-floater should get ≥1 on-call
-    for d, slack in min_one_slack.items():
-        assigned = cp.sum([x[d, s, t]
-                           for s in S for t in posts_by_day[s]
-                           if t in oncall_posts])
-        constraints.append(slack >= 1 - assigned)
-        penalty_terms.append(lambda_min_one * slack)
+    min_one_slack = cp.Variable(int(nonfloater.sum()), nonneg=True)
+    constraints += [min_one_slack >= 1 - assigned, min_one_slack <= 1]
+    penalty_terms.append(lambda_min_one * cp.sum(min_one_slack))
 
     # === Fairness objective: workload deviation ===
-    workload_expr = []
-    avg_wl = np.mean([
-        info["workload"]["weekday"] +
-        info["workload"]["weekend"] +
-        info["workload"]["ED"]
-        for info in doctor_info.values()
-        if info["category"] != "floater"
-    ])
-    for d in D:
-        if doctor_info[d]["category"] == "floater":
-            continue
-        past = sum(doctor_info[d]["workload"].values())
-        assigned = cp.sum([x[d, s, t]
-                           for s in S for t in posts_by_day[s]
-                           if t in oncall_posts])
-        workload_expr.append(cp.abs(past + assigned - avg_wl))
+    past = past_workload.sum(axis=1)[nonfloater]
+    avg_wl = past.mean()
+    # workload_dev = |past + assigned - avg_wl| as the usual pair of linear inequalities
+    workload_dev = cp.Variable(int(nonfloater.sum()), nonneg=True)
+    constraints += [workload_dev >= past + assigned - avg_wl,
+                    workload_dev >= avg_wl - past - assigned]
 
     # === Full objective ===
     objective = cp.Minimize(
-        sum(workload_expr)
-        + lambda_rest   * sum(rest_violation.values())
-        - lambda_gap    * sum(z_gap.values())
-        + sum(penalty_terms)
+        cp.sum(workload_dev)
+        + lambda_rest   * cp.sum(rest_violation)
+        - lambda_gap    * cp.sum(z_gap)
+        + cp.sum(cp.multiply(W, x))
+        + cp.sum(cp.hstack(penalty_terms))
     )
 
     prob = cp.Problem(objective, constraints)
-    prob.solve(solver=cp.CBC, verbose=True, maximumSeconds=600)
-
-    return prob, x
+    return prob, x, relax
+
+def solve_phase(RELAX: bool):
+    relax.value = 1.0 if RELAX else 0.0
+    # warm_start: when both phases run in this process, Phase 2 starts from Phase 1's incumbent (HiGHS)
+    prob.solve(verbose=True, warm_start=True, **SOLVER_OPTS)
+    return prob.status, x.value
+
+def solve_phase_in_child(RELAX: bool, conn):
+    conn.send(solve_phase(RELAX))
+    conn.close()
+
+def start_phase(RELAX: bool):
+    # fork shares the compiled model with the child; only (status, x.value) is pickled back
+    fork_context = multiprocessing.get_context("fork")
+    receiver, sender = fork_context.Pipe(duplex=False)
+    process = fork_context.Process(target=solve_phase_in_child, args=(RELAX, sender), daemon=True)
+    process.start()
+    sender.close()
+    return process, receiver
+
+def collect_phase(phase):
+    process, receiver = phase
+    result = receiver.recv()  # EOFError if the solver process died without a result
+    receiver.close()
+    process.join()
+    return result
 
 # --------------------------------------------------------------------------------
+prob, x, relax = build_model()
+
 # === Phase 1: try the original (hard) model ===
-prob1, x1 = build_and_solve(RELAX=False)
-print("Phase 1 status:", prob1.status)
+if PARALLEL_PHASES:
+    # Phase 2 is only used when Phase 1 fails, so it runs speculatively next to Phase 1.
+    # Compile before forking so both children reuse the canonicalization.
+    relax.value = 0.0
+    prob.get_problem_data(SOLVER_OPTS["solver"], canon_backend=SOLVER_OPTS["canon_backend"])
+    phase1, phase2 = start_phase(RELAX=False), start_phase(RELAX=True)
+    status1, x_value = collect_phase(phase1)
+else:
+    status1, x_value = solve_phase(RELAX=False)
+print("Phase 1 status:", status1)
 
 ok_statuses = {"optimal", "optimal_inaccurate", "user_limit"}  # accept if time-limited but feasible
-if prob1.status in ok_statuses:
-    chosen_x = x1
+if status1 in ok_statuses:
     print("Using Phase 1 solution.")
+    if PARALLEL_PHASES:
+        phase2[0].terminate()
+        phase2[0].join()
 else:
-    print("Phase 1 not successful (status:", prob1.status, ") → Trying relaxed Phase 2...")
-    # === Phase 2: relaxed model with Big-M slack penalties on hard constraints ===
-    prob2, x2 = build_and_solve(RELAX=True)
-    print("Phase 2 status:", prob2.status)
-    chosen_x = x2  # even if time-limited, we keep the best found here
+    print("Phase 1 not successful (status:", status1, ") → Trying relaxed Phase 2...")
+    # === Phase 2: same model with the Big-M slacks on hard constraints switched on ===
+    status2, x_value = collect_phase(phase2) if PARALLEL_PHASES else solve_phase(RELAX=True)
+    print("Phase 2 status:", status2)
+    # even if time-limited, we keep the best found here
 
 # === Collect on-call results using the chosen solution ===
-raw_results = []
-for (d, s, t), var in chosen_x.items():
-    if var.value is not None and var.value > 0.5:
-        raw_results.append((d, date_list[s], t))
+if x_value is not None:
+    d_i, s_i, t_i = np.nonzero(x_value > 0.5)
+else:
+    d_i = s_i = t_i = np.array([], dtype=int)
+df_raw = pd.DataFrame({
+    "Doctor": np.array(D, dtype=object)[d_i],
+    "Date": np.array(date_list, dtype=object)[s_i],
+    "Post": np.array(all_posts, dtype=object)[t_i]
+})
 
 # --------------------------------------------------------------------------------
 # Build final results: expand 2-day standby and then add all clinic entries
-results = []
-
-# 1) Expand standby: Saturday → Saturday + Sunday
-for d, date_assigned, post in raw_results:
-    if post == "Standby Oncall" and date_assigned.weekday() == 5:
-        results.append((d, date_assigned, post))
-        results.append((d, date_assigned + datetime.timedelta(days=1), post))
-    elif post == "Standby Oncall" and date_assigned.weekday() == 6:
-        # skip Sunday, handled by Saturday
-        continue
-    else:
-        results.append((d, date_assigned, post))
+
+# 1) Expand standby: Saturday → Saturday + Sunday (Sunday rows are handled by Saturday)
+weekday = np.array([date.weekday() for date in date_list], dtype=int)[s_i]
+standby = is_standby[t_i]
+sat = df_raw[standby & (weekday == 5)]
+sun = sat.assign(Date=[date + datetime.timedelta(days=1) for date in sat["Date"]])
+# sun keeps sat's index, so a stable sort puts each Sunday right after its Saturday
+df_oncall = pd.concat([df_raw[~(standby & (weekday == 6))], sun]).sort_index(kind="stable")
 
 # 2) Add clinic: every doctor in unit on each clinic day
-for u, weekdays in clinic_days.items():
-    unit_docs = [d for d in D if doctor_info[d]["unit"] == u]
-    for s, date in enumerate(date_list):
-        if date.weekday() in weekdays:
-            for d in unit_docs:
-                results.append((d, date, "clinic"))
+clinic_mask = (~capped_unit_day)[:, :, None] & (unit_membership > 0)[:, None, :]
+_, c_s, c_d = np.nonzero(clinic_mask)
+df_clinic = pd.DataFrame({
+    "Doctor": np.array(D, dtype=object)[c_d],
+    "Date": np.array(date_list, dtype=object)[c_s],
+    "Post": "clinic"
+})
 
 # === Save schedule ===
-df_schedule = pd.DataFrame(results, columns=["Doctor", "Date", "Post"])
+df_schedule = pd.concat([df_oncall, df_clinic], ignore_index=True)
 df_schedule.to_csv("primeVersion2_schedule.csv", index=False)
 print("Schedule saved to primeVersion2_schedule.csv")
 
 # === Export availability for checking ===
-avail_records = []
-for (d, s, t), avail in availability.items():
-    avail_records.append({
-        "Doctor": d,
-        "Date": date_list[s],
-        "Post": t,
-        "Available": avail
-    })
-pd.DataFrame(avail_records).to_csv("primeVersion2_availability.csv", index=False)
+# One row per (doctor, day, post) cell that exists, built column-wise from the array
+d_i, s_i, t_i = np.nonzero(np.broadcast_to(valid, avail_arr.shape))
+pd.DataFrame({
+    "Doctor": np.array(D)[d_i],
+    "Date": np.array(date_list)[s_i],
+    "Post": np.array(all_posts)[t_i],
+    "Available": avail_arr[d_i, s_i, t_i]
+}).to_csv("primeVersion2_availability.csv", index=False)
 print("Availability saved to primeVersion2_availability.csv")
 
 # === Export doctor metadata for checking ===
-info_records = []
-for d, info in doctor_info.items():
-    info_records.append({
-        "Doctor": d,
-        "Unit": info["unit"],
-        "Category": info["category"],
-        "LastStandby": info["last_standby"],
-        "Workload_weekday": info["workload"]["weekday"],
-        "Workload_weekend": info["workload"]["weekend"],
-        "Workload_ED": info["workload"]["ED"]
-    })
-pd.DataFrame(info_records).to_csv("primeVersion2_doctor_info.csv", index=False)
+# Last Standby is the first of the month months_back before the roster month
+standby_month = roster_start.year * 12 + roster_start.month - 1 - months_back
+pd.DataFrame({
+    "Doctor": D,
+    "Unit": np.array(units)[doctor_unit],
+    "Category": np.array(categories)[doctor_cat],
+    "LastStandby": [None if c == FLOATER else datetime.date(m // 12, m % 12 + 1, 1)
+                    for c, m in zip(doctor_cat, standby_month)],
+    "Workload_weekday": past_workload[:, 0],
+    "Workload_weekend": past_workload[:, 1],
+    "Workload_ED": past_workload[:, 2]
+}).to_csv("primeVersion2_doctor_info.csv", index=False)
 print("Doctor info saved to primeVersion2_doctor_info.csv")